@@ -7,9 +7,8 @@ df = pd.read_csv('road_water_levels.csv', parse_dates=['Timestamp'])
 # Load SpaCy's English model
 nlp = spacy.load("en_core_web_sm")
 
-# Function to extract entities from the query
-def parse_query(query):
-    doc = nlp(query)
+# Function to extract entities from a parsed query
+def _entities(doc):
     road_id = None
     timestamp = None
     for ent in doc.ents:
@@ -19,6 +18,14 @@ def parse_query(query):
             road_id = f"Road_{ent.text}"
     return road_id, timestamp
 
+# Function to extract entities from the query
+def parse_query(query):
+    return _entities(nlp(query))
+
+# Parse many queries at once; nlp.pipe batches them through the pipeline
+def parse_queries(queries, batch_size=256):
+    return [_entities(doc) for doc in nlp.pipe(queries, batch_size=batch_size)]
+
 # Function to get water level based on the parsed query
 def get_water_level(query):
     road_id, timestamp = parse_query(query)
@@ -33,9 +40,10 @@ def get_water_level(query):
     else:
         return "Could not understand the query. Please specify road number and time."
 
-# Take user input
-query = input("Please enter your query (e.g., 'What was the water level on road 101 at 12:00 PM on 15th October?'): ")
+if __name__ == "__main__":
+    # Take user input
+    query = input("Please enter your query (e.g., 'What was the water level on road 101 at 12:00 PM on 15th October?'): ")
 
-# Process the query and output the result
-response = get_water_level(query)
-print(response)
+    # Process the query and output the result
+    response = get_water_level(query)
+    print(response)
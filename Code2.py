@@ -1,14 +1,12 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import pandas as pd
 import json
+from t5_inference import load_t5
 
 # Load the CSV file containing water level data
 df = pd.read_csv('road_water_levels.csv', parse_dates=['Timestamp'])
 
-# Load a pre-trained model and tokenizer from Hugging Face
-model_name = "google/flan-t5-small"  # T5 model for generating structured responses
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+# Load flan-t5 through the inference backend selected with T5_BACKEND (fp32, int8 or onnx)
+tokenizer, model = load_t5()
 
 # Function to generate structured output from the natural language query
 def generate_structured_query(query):
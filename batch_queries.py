@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import json
+import statistics
+import sys
+import time
+
+import query_parser
+from query_plan import QueryPlan
+from result_cache import ResultCache
+from water_engine import answer_many, format_answer
+from water_store import load_store
+
+# Batch mode for workload files: one query per JSONL line, either
+# {"id": ..., "query": "natural language"}, {"id": ..., "structured": {...}}
+# or a bare JSON string. Lines are read a chunk at a time; each chunk is parsed
+# in bulk (rules first, the rest through flan-t5 in padded batches, or spaCy's
+# nlp.pipe), compiled, and answered grouped by road and action. Results stream
+# out as JSONL in input order, with a throughput and latency summary on stderr.
+
+CHUNK_LINES = 1000
+SPACY_UNPARSEABLE = {"error": "Could not understand the query. Please specify road number and time."}
+
+
+def read_workload(lines):
+    """(id, natural-language query or None, structured query or None) for each non-blank JSONL line"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, None, {"error": f"Invalid JSON on line {number}: {e.msg}"}
+            continue
+        if isinstance(item, str):
+            yield number, item, None
+        elif isinstance(item, dict) and isinstance(item.get("structured"), dict):
+            yield item.get("id", number), None, item["structured"]
+        elif isinstance(item, dict) and isinstance(item.get("query"), str):
+            yield item.get("id", number), item["query"], None
+        else:
+            yield item.get("id", number) if isinstance(item, dict) else number, None, \
+                {"error": "Expected a \"query\" string or a \"structured\" object"}
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _spacy_parser():
+    import Code
+
+    def parse(queries):
+        parsed = []
+        for road_id, timestamp in Code.parse_queries(queries):
+            if road_id and timestamp is not None:
+                parsed.append({"action": "retrieve_water_level", "road_id": road_id, "timestamp": str(timestamp)})
+            else:
+                parsed.append(dict(SPACY_UNPARSEABLE))
+        return parsed
+    return parse
+
+
+def _parse_chunk(parse, queries):
+    """Parse a chunk in bulk; if that fails (say flan-t5 can't load), parse query by query"""
+    if not queries:
+        return []
+    try:
+        return parse(queries)
+    except Exception:
+        pass
+    parsed = []
+    for query in queries:
+        try:
+            parsed.extend(parse([query]))
+        except Exception as e:
+            parsed.append({"error": f"Error processing query: {str(e)}"})
+    return parsed
+
+
+def _compile(query_data):
+    try:
+        return QueryPlan.from_dict(query_data)
+    except (TypeError, ValueError) as e:
+        return QueryPlan(error=f"Error processing query: {str(e)}")
+
+
+def run(store, lines, out, parse, chunk_lines=CHUNK_LINES, text=False, cache=None):
+    """Answer a JSONL workload, writing one JSONL result per query; returns the run's statistics"""
+    stats = {"queries": 0, "errors": 0, "chunks": 0, "parse_seconds": 0.0, "answer_seconds": 0.0,
+             "groups": []}
+    for chunk in _chunks(read_workload(lines), chunk_lines):
+        stats["chunks"] += 1
+        began = time.perf_counter()
+        queries = [query for _, query, _ in chunk if query is not None]
+        parsed = iter(_parse_chunk(parse, queries))
+        structured = [query_data if query_data is not None else next(parsed) for _, _, query_data in chunk]
+        plans = [_compile(query_data) for query_data in structured]
+        stats["parse_seconds"] += time.perf_counter() - began
+
+        began = time.perf_counter()
+        results = [None] * len(chunk)
+        # Results arrive grouped by road and action, and a group's point lookups are answered
+        # together, so latency is measured per group
+        group, last = None, began
+        for i, result in answer_many(store, plans, cache):
+            key = (plans[i].road_id, plans[i].action)
+            if key != group:
+                now = time.perf_counter()
+                if group is not None:
+                    stats["groups"].append(now - last)
+                group, last = key, now
+            results[i] = result
+        now = time.perf_counter()
+        if group is not None:
+            stats["groups"].append(now - last)
+        stats["answer_seconds"] += now - began
+
+        for (query_id, _, _), plan, result in zip(chunk, plans, results):
+            record = {"id": query_id, "structured": plan.to_dict(), "result": result}
+            if text:
+                record["text"] = format_answer(result)
+            out.write(json.dumps(record) + "\n")
+            stats["queries"] += 1
+            stats["errors"] += "error" in result
+        out.flush()
+    return stats
+
+
+def _percentile(values, q):
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] if len(values) > 1 else values[0]
+
+
+def print_summary(stats, seconds, file=sys.stderr):
+    queries = stats["queries"]
+    print(f"{queries} queries ({stats['errors']} errors) in {stats['chunks']} chunks, {seconds:.2f} s, "
+          f"{queries / seconds if seconds else 0:.0f} queries/s", file=file)
+    print(f"  parse {stats['parse_seconds']:.2f} s, answer {stats['answer_seconds']:.2f} s "
+          f"({stats['answer_seconds'] / queries * 1e6 if queries else 0:.1f} us per query)", file=file)
+    latencies = [latency * 1e3 for latency in stats["groups"]]
+    if latencies:
+        print(f"  {len(latencies)} road/action groups, latency ms: p50 {_percentile(latencies, 50):.3f}  "
+              f"p95 {_percentile(latencies, 95):.3f}  p99 {_percentile(latencies, 99):.3f}  "
+              f"max {max(latencies):.3f}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL workload of water level queries in bulk")
+    parser.add_argument("workload", help="JSONL file of queries, or - for stdin")
+    parser.add_argument("--output", default="-", help="JSONL file for the results, or - for stdout")
+    parser.add_argument("--data", default="road_water_levels_large.csv")
+    parser.add_argument("--parser", choices=("rules", "spacy"), default="rules",
+                        help="rules with flan-t5 fallback, or spaCy entities (point lookups only)")
+    parser.add_argument("--chunk", type=int, default=CHUNK_LINES, help="lines parsed and answered together")
+    parser.add_argument("--t5-batch", type=int, default=query_parser.T5_BATCH_SIZE,
+                        help="queries per flan-t5 generate call")
+    parser.add_argument("--text", action="store_true", help="also include the formatted sentence")
+    parser.add_argument("--no-cache", action="store_true", help="answer every query, even repeated ones")
+    args = parser.parse_args()
+
+    store = load_store(args.data)
+    cache = None if args.no_cache else ResultCache(store)
+    if args.parser == "spacy":
+        parse = _spacy_parser()
+    else:
+        def parse(queries):
+            return query_parser.parse_queries(queries, batch_size=args.t5_batch)
+
+    began = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        lines = sys.stdin if args.workload == "-" else stack.enter_context(open(args.workload))
+        out = sys.stdout if args.output == "-" else stack.enter_context(open(args.output, "w"))
+        stats = run(store, lines, out, parse, args.chunk, args.text, cache)
+    print_summary(stats, time.perf_counter() - began)
+    if cache is not None:
+        print(f"  result cache: {cache.stats()}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
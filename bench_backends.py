@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import query_parser
+import t5_inference
+
+# Queries the keyword rules can't settle, so every one of them reaches flan-t5
+CORPUS = [
+    "What is the higest water level on road 101?",
+    "What was the water levl on road 102?",
+    "Whats the lowst reading for road 7?",
+    "How high did the water get on road 12?",
+    "Give me evrything recorded for road 5",
+    "What was the typical level on road 33?",
+    "road 18 water at 2024-10-03 10:00:00 please",
+    "Peak flooding on road 64 between 2024-10-02 00:00:00 and 2024-10-04 00:00:00?",
+    "Is road 9 flooded now?",
+    "Which was the worst water level on road 41?",
+]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in megabytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(backend, decoding, repeats):
+    """Parse the corpus with one backend and report outputs, latency and memory"""
+    t5_inference.T5_BACKEND = backend
+    query_parser.T5_DECODING = decoding
+    start = time.perf_counter()
+    t5_inference.load_t5(backend)
+    load_seconds = time.perf_counter() - start
+
+    outputs, latencies = [], []
+    for i in range(repeats):
+        for query in CORPUS:
+            start = time.perf_counter()
+            output = query_parser.generate_with_t5(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if i == 0:
+                outputs.append(json.loads(output) if output.startswith("{") else output)
+    latencies.sort()
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "peak_rss_mb": peak_rss_mb(),
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check and benchmark for the flan-t5 inference backends")
+    parser.add_argument("--backends", default=",".join(t5_inference.BACKENDS),
+                        help="comma-separated backends to compare; the first is the reference")
+    parser.add_argument("--decoding", default=query_parser.T5_DECODING, choices=("constrained", "free"))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # Child process: one backend per process so resident memory is measured in isolation
+        print(json.dumps(run_backend(args.worker, args.decoding, args.repeats)))
+        return 0
+
+    results = []
+    for backend in args.backends.split(","):
+        command = [sys.executable, os.path.abspath(__file__), "--worker", backend,
+                   "--decoding", args.decoding, "--repeats", str(args.repeats)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{backend}: failed\n{completed.stderr.strip()}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'backend':<8} {'load s':>8} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'peak RSS MB':>12}")
+    for result in results:
+        print(f"{result['backend']:<8} {result['load_seconds']:>8.2f} {result['mean_ms']:>9.1f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['peak_rss_mb']:>12.0f}")
+
+    # Parity: every backend must produce the same structured queries as the reference
+    mismatches = 0
+    if results:
+        reference = results[0]
+        for result in results[1:]:
+            for query, expected, actual in zip(CORPUS, reference["outputs"], result["outputs"]):
+                if expected != actual:
+                    mismatches += 1
+                    print(f"MISMATCH [{result['backend']}] {query}\n  {reference['backend']}: {expected}\n"
+                          f"  {result['backend']}: {actual}")
+        print(f"\nParity: {mismatches} mismatches against {reference['backend']} "
+              f"on {len(CORPUS)} queries")
+    return 1 if mismatches or len(results) < len(args.backends.split(",")) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
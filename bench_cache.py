@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from bench_rollups import synthetic_frame
+from result_cache import ResultCache
+from water_engine import answer
+from water_store import store_from_frame
+
+# Result cache under live appends: the same queries are asked after every
+# append, through the cache and straight from the store, and the two answers
+# must match. Appends alternate between ordinary rows, rows of gaps only and
+# rows with readings on a few roads, which is where invalidation that is too
+# narrow serves stale answers.
+
+
+def workload(road_ids, rng, count):
+    roads = [str(road) for road in rng.choice(road_ids, count)]
+    queries = []
+    for road in roads:
+        queries += [
+            {"action": "retrieve_flood_events", "road_id": road},
+            {"action": "retrieve_flood_events", "road_id": road, "window": "7D", "threshold": 3.0},
+            {"action": "retrieve_time_above_threshold", "road_id": road},
+            {"action": "retrieve_time_above_threshold", "road_id": road, "threshold": "watch", "window": "30D"},
+            {"action": "retrieve_longest_flood", "road_id": road, "threshold": 3.0},
+            {"action": "retrieve_max_water_level", "road_id": road},
+            {"action": "retrieve_average_water_level", "road_id": road},
+            {"action": "retrieve_latest_water_level", "road_id": road},
+            {"action": "retrieve_all_water_levels", "road_id": road, "page_size": 50},
+        ]
+    queries += [
+        {"action": "retrieve_roads_above_threshold", "threshold": 3.0},
+        {"action": "retrieve_top_roads", "k": 5, "window": "7D"},
+        {"action": "count_flooded_roads_per_hour", "threshold": 3.0, "window": "2D"},
+    ]
+    return queries
+
+
+def append_rows(df, lo, hi, kind, rng):
+    """Rows [lo, hi) of the frame as an append of the given kind"""
+    rows = df.iloc[lo:hi].copy()
+    roads = [col for col in rows.columns if col.startswith('Road_')]
+    if kind == "gaps":
+        rows[roads] = np.nan
+    elif kind == "few roads":
+        keep = set(rng.choice(roads, 3, replace=False))
+        rows[[road for road in roads if road not in keep]] = np.nan
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cached answers against fresh ones while rows are appended")
+    parser.add_argument("--years", type=float, default=0.25)
+    parser.add_argument("--roads", type=int, default=20)
+    parser.add_argument("--appends", type=int, default=60)
+    parser.add_argument("--rows", type=int, default=6, help="rows per append")
+    parser.add_argument("--queries", type=int, default=8, help="roads asked about")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.years, args.roads, args.seed)
+    rng = np.random.default_rng(args.seed)
+    initial = len(df) - args.appends * args.rows
+    store = store_from_frame(df.iloc[:initial].reset_index(drop=True))
+    cache = ResultCache(store)
+    queries = workload(store.road_ids, rng, args.queries)
+
+    mismatches = 0
+    began = time.perf_counter()
+    for step in range(args.appends + 1):
+        if step:
+            lo = initial + (step - 1) * args.rows
+            kind = ("rows", "gaps", "few roads")[step % 3]
+            store.append(append_rows(df, lo, lo + args.rows, kind, rng))
+        for query in queries:
+            cached, fresh = answer(store, query, cache), answer(store, query)
+            if json.dumps(cached) != json.dumps(fresh):
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"STALE after append {step}: {query}\n  cached: {json.dumps(cached)[:200]}\n"
+                          f"  fresh:  {json.dumps(fresh)[:200]}")
+    stats = cache.stats()
+    print(f"{len(queries)} queries x {args.appends + 1} rounds in {time.perf_counter() - began:.1f} s; "
+          f"hit rate {stats['hit_rate']:.2f}, {stats['invalidations']} invalidations")
+    print(f"Exactness: {mismatches} stale answers served from the cache")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from water_index import RangeExtremumIndex
+
+# Range max/min positions from RangeExtremumIndex checked against pandas'
+# Series.idxmax/idxmin on random slices, over readings with coarse values (so
+# ties are common), scattered gaps, runs of gaps and slices that are all gaps.
+# One index is built at once and one grown through extend, as appends do.
+
+
+def readings(rows, rng):
+    values = np.round(rng.uniform(0, 5, rows), 1)
+    values[rng.random(rows) < 0.05] = np.nan
+    for start in rng.integers(0, rows, rows // 500 + 1):
+        values[start:start + rng.integers(1, 50)] = np.nan
+    return values
+
+
+def expected(series, lo, hi, kind):
+    window = series.iloc[lo:hi]
+    if not window.notna().any():
+        return None
+    return int(window.idxmax() if kind == 'max' else window.idxmin())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check range max/min positions against pandas idxmax/idxmin")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    values = readings(args.rows, rng)
+    series = pd.Series(values)
+    mismatches = 0
+    timings = {"index": [], "pandas": []}
+    for kind in ('max', 'min'):
+        built = RangeExtremumIndex(values, kind)
+        grown = RangeExtremumIndex(values[:1], kind)
+        for start in range(1, args.rows, 997):
+            grown.extend(values[start:start + 997])
+        for _ in range(args.queries):
+            lo = int(rng.integers(0, args.rows))
+            # Mostly short slices, some up to the whole history
+            width = int(rng.integers(1, 64)) if rng.random() < 0.5 else int(rng.integers(1, args.rows + 1))
+            hi = min(args.rows, lo + width)
+            began = time.perf_counter()
+            position = built.query(lo, hi)
+            timings["index"].append(time.perf_counter() - began)
+            began = time.perf_counter()
+            reference = expected(series, lo, hi, kind)
+            timings["pandas"].append(time.perf_counter() - began)
+            for label, actual in (("built", position), ("grown", grown.query(lo, hi))):
+                if actual != reference:
+                    mismatches += 1
+                    if mismatches <= 5:
+                        print(f"MISMATCH [{label}] {kind} rows {lo}..{hi}: index {actual}, pandas {reference}")
+
+    index_us, pandas_us = (statistics.median(timings[label]) * 1e6 for label in ("index", "pandas"))
+    print(f"{2 * args.queries} slices of {args.rows} readings; median us per query: "
+          f"index {index_us:.1f}, pandas {pandas_us:.1f}")
+    print(f"Exactness: {mismatches} mismatches against pandas")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
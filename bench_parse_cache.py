@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import query_parser
+from query_parser import ParseCache, parse_rule_based
+
+# Template parse cache checked against the rules: every query is parsed through
+# the cache and straight by the rules, and the two must agree. Queries repeat
+# templates with fresh values, and some put the same timestamp or road in two
+# slots, which must not teach the cache a template that binds both fields to
+# one slot. The cache is also saved and reloaded, including a file holding
+# such a template from an older run.
+
+TEMPLATES = [
+    "What was the maximum water level on road {r0} between {t0} and {t1}?",
+    "What was the minimum water level on road {r0} between {t0} and {t1}?",
+    "What was the average water level on road {r0} between {t0} and {t1}?",
+    "Show all water levels on road {r0} between {t0} and {t1}",
+    "What was the water level on road {r0} at {t0}?",
+    "What is the highest water level on road {r0}?",
+    "What was the water level on road {r0} around {t0}?",
+]
+
+
+def timestamp(rng):
+    return f"2024-10-{rng.integers(1, 15):02d} {rng.integers(0, 24):02d}:00:00"
+
+
+def workload(count, rng):
+    queries = []
+    for _ in range(count):
+        first = timestamp(rng)
+        # One query in four repeats its first timestamp
+        second = first if rng.random() < 0.25 else timestamp(rng)
+        template = TEMPLATES[rng.integers(len(TEMPLATES))]
+        queries.append(template.format(r0=rng.integers(1, 101), t0=first, t1=second))
+    return queries
+
+
+def check(queries, label):
+    mismatches = 0
+    for query in queries:
+        cached, expected = query_parser.parse_query(query), parse_rule_based(query)
+        if cached != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH [{label}] {query}\n  cache: {cached}\n  rules: {expected}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check parse-cache answers against the rule-based parser")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    queries = workload(args.queries, rng)
+    query_parser.parse_cache = ParseCache()
+    mismatches = check(queries, "warm")
+    stats = query_parser.parse_cache.stats()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "parse_cache.json")
+        query_parser.parse_cache.save(path)
+        with open(path) as f:
+            entries = json.load(f)
+        # A template from before ambiguous parses were skipped: both timestamps bound to the second slot
+        key, _ = ParseCache.template(TEMPLATES[0].format(r0=7, t0="2024-10-01 00:00:00", t1="2024-10-02 00:00:00"))
+        entries.append([key, {"action": "retrieve_max_water_level_in_range", "road_id": "<r0>",
+                              "start_timestamp": "<t1>", "end_timestamp": "<t1>"}])
+        with open(path, 'w') as f:
+            json.dump(entries, f)
+        query_parser.parse_cache = ParseCache()
+        query_parser.parse_cache.load(path)
+        mismatches += check(queries, "reloaded")
+
+    cached, rules = [], []
+    for query in queries[:500]:
+        began = time.perf_counter()
+        query_parser.parse_query(query)
+        cached.append(time.perf_counter() - began)
+        began = time.perf_counter()
+        parse_rule_based(query)
+        rules.append(time.perf_counter() - began)
+    print(f"{len(queries)} queries, hit rate {stats['hit_rate']:.2f}, {stats['entries']} templates; median us: "
+          f"cache {statistics.median(cached) * 1e6:.1f}, rules {statistics.median(rules) * 1e6:.1f}")
+    print(f"Exactness: {mismatches} mismatches against the rules")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import argparse
+import statistics
+import sys
+import time
+
+from query_parser import compile_query, generate_structured_query
+from result_cache import ResultCache
+from water_engine import answer
+from water_store import load_store
+
+# Per-query overhead outside the data: parsing with a warm parse cache, and
+# answering from a warm result cache, for the JSON text form of a query
+# against a compiled QueryPlan. Uncached answers are timed too, to show how
+# much of a whole query the overhead is.
+QUERIES = [
+    "What is the highest water level on road 7?",
+    "What was the water level on road 12 at 2024-10-03 05:00:00?",
+    "What was the average water level on road 3 between 2024-10-02 00:00:00 and 2024-10-09 00:00:00?",
+    "What was the maximum water level on road 8 between 2024-10-10 08:00:00 and 2024-10-12 18:00:00?",
+    "Which roads are above 4 m right now?",
+]
+
+
+def median_us(function, repeat):
+    latencies = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - began)
+    return statistics.median(latencies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-query overhead of JSON queries against compiled plans")
+    parser.add_argument("--data", default="road_water_levels_large.csv")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    store = load_store(args.data)
+    cache = ResultCache(store)
+    # Warm the parse cache, the result cache and the indexes
+    for query in QUERIES:
+        answer(store, compile_query(query), cache)
+
+    print(f"{'median us':<70} {'JSON':>8} {'plan':>8}")
+    for query in QUERIES:
+        text, plan = generate_structured_query(query), compile_query(query)
+        timings = {
+            "parse": (median_us(lambda: generate_structured_query(query), args.repeat),
+                      median_us(lambda: compile_query(query), args.repeat)),
+            "cached answer": (median_us(lambda: answer(store, text, cache), args.repeat),
+                              median_us(lambda: answer(store, plan, cache), args.repeat)),
+            "uncached answer": (median_us(lambda: answer(store, text), args.repeat // 10 or 1),
+                                median_us(lambda: answer(store, plan), args.repeat // 10 or 1)),
+        }
+        print(query)
+        for stage, (as_json, as_plan) in timings.items():
+            print(f"  {stage:<68} {as_json:>8.1f} {as_plan:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
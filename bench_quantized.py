@@ -0,0 +1,124 @@
+import argparse
+import math
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from water_cross import flooded_per_hour, roads_above, top_roads
+from water_engine import answer
+from water_store import store_from_frame
+
+# Memory and cross-road scan latency of a float64 store against the same data
+# held as int16 millimetre codes, with an exactness check that every engine
+# answer from the quantized store matches the float one.
+
+
+def synthetic_frame(days, roads, seed):
+    """Hourly readings in 0-5 m rounded to millimetres, like gen_csv.py, with some gaps"""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range("2024-01-01", periods=days * 24, freq="h")
+    data = {"Timestamp": timestamps}
+    for i in range(1, roads + 1):
+        values = np.round(rng.uniform(0, 5, len(timestamps)), 3)
+        values[rng.random(len(timestamps)) < 0.01] = np.nan
+        data[f"Road_{i}"] = values
+    return pd.DataFrame(data)
+
+
+def sample_queries(store, rng, count):
+    """Structured queries over every action, on random roads, times and windows"""
+    first, last = store.first_timestamp(), store.last_timestamp()
+    queries = []
+    for _ in range(count):
+        road = store.road_ids[rng.integers(len(store.road_ids))]
+        start = first + (last - first) * rng.random()
+        end = start + pd.Timedelta(hours=int(rng.integers(1, 24 * 60)))
+        span = {"start_timestamp": str(start), "end_timestamp": str(end)}
+        at = str(store.timestamp_at(int(rng.integers(len(store)))))
+        threshold = round(float(rng.uniform(2.5, 4.9)), 3)
+        queries += [
+            {"action": "retrieve_max_water_level", "road_id": road},
+            {"action": "retrieve_min_water_level", "road_id": road},
+            {"action": "retrieve_average_water_level", "road_id": road},
+            {"action": "retrieve_latest_water_level", "road_id": road},
+            {"action": "retrieve_water_level", "road_id": road, "timestamp": at},
+            {"action": "retrieve_max_water_level_in_range", "road_id": road, **span},
+            {"action": "retrieve_min_water_level_in_range", "road_id": road, **span},
+            {"action": "retrieve_average_water_level_in_range", "road_id": road, **span},
+            {"action": "retrieve_all_water_levels_in_range", "road_id": road, "page_size": 50, **span},
+            {"action": "retrieve_flood_events", "road_id": road, "threshold": threshold},
+            {"action": "retrieve_roads_above_threshold", "threshold": threshold, "timestamp": at},
+            {"action": "retrieve_roads_above_threshold", "threshold": threshold, **span},
+            {"action": "retrieve_top_roads", "k": 10, "metric": "max", **span},
+            {"action": "retrieve_top_roads", "k": 10, "metric": "mean", **span},
+            {"action": "count_flooded_roads_per_hour", "threshold": threshold, **span},
+        ]
+    return queries
+
+
+def same(expected, actual):
+    """Equal answers, allowing float rounding only in means and spreads"""
+    if isinstance(expected, dict):
+        return (isinstance(actual, dict) and expected.keys() == actual.keys() and
+                all(same(expected[key], actual[key]) for key in expected))
+    if isinstance(expected, (list, tuple)):
+        return len(expected) == len(actual) and all(same(a, b) for a, b in zip(expected, actual))
+    if isinstance(expected, float) and isinstance(actual, float):
+        return expected == actual or math.isclose(expected, actual, rel_tol=1e-12, abs_tol=1e-12)
+    return expected == actual
+
+
+def timed(function, repeat):
+    latencies = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - began) * 1000)
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare float64 and int16 fixed-point storage of water levels")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--roads", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=40, help="random query sets to check")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.days, args.roads, args.seed)
+    stores = {"float64": store_from_frame(df), "int16": store_from_frame(df, quantize_roads=True)}
+    print(f"{len(stores['float64'])} hourly rows x {args.roads} roads, "
+          f"{len(stores['int16'].encoding)} roads quantized")
+    for name, store in stores.items():
+        for road in store.road_ids:
+            store.column(road)
+        print(f"{name:<8} {store.nbytes() / 1024**2:8.1f} MiB of readings")
+
+    first, last = stores["float64"].first_timestamp(), stores["float64"].last_timestamp()
+    scans = {
+        "roads above 4 m": lambda store: roads_above(store, 4.0, start=first, end=last),
+        "top 10 by mean": lambda store: top_roads(store, 10, "mean", first, last),
+        "flooded per hour": lambda store: flooded_per_hour(store, 4.0, first, last),
+    }
+    print(f"\n{'whole-record scan':<18} {'float64 ms':>11} {'int16 ms':>9}")
+    for label, scan in scans.items():
+        latency = {name: timed(lambda: scan(store), args.repeat) for name, store in stores.items()}
+        print(f"{label:<18} {latency['float64']:>11.1f} {latency['int16']:>9.1f}")
+
+    queries = sample_queries(stores["float64"], np.random.default_rng(args.seed), args.queries)
+    mismatches = 0
+    for query_data in queries:
+        expected, actual = (answer(store, query_data) for store in stores.values())
+        if not same(expected, actual):
+            mismatches += 1
+            print(f"MISMATCH {query_data}\n  float64: {expected}\n  int16:   {actual}")
+    print(f"\nExactness: {mismatches} mismatches in {len(queries)} answers")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
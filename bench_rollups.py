@@ -0,0 +1,142 @@
+import argparse
+import math
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import water_store
+from water_engine import answer
+from water_store import store_from_frame
+
+# Latency of range summaries over 1-day, 1-year and 5-year windows, answered by
+# scanning the rows, by the rollup pyramid and by the per-row sparse indexes,
+# with an exactness check of the two indexes against the scan. Engine answers
+# for ranges given only a start or only an end are checked against a scan up
+# to the latest reading or from the first.
+WINDOWS = {"1d": pd.Timedelta(days=1), "1y": pd.Timedelta(days=365), "5y": pd.Timedelta(days=5 * 365)}
+
+
+def synthetic_frame(years, roads, seed):
+    """Hourly readings with a seasonal cycle, noise and some missing values"""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range("2019-01-01", periods=int(years * 365.25 * 24), freq="h")
+    season = 2.5 + 1.5 * np.sin(np.arange(len(timestamps)) * 2 * np.pi / (365.25 * 24))
+    data = {"Timestamp": timestamps}
+    for i in range(1, roads + 1):
+        values = np.round(season + rng.normal(0, 0.8, len(timestamps)), 3)
+        values[rng.random(len(timestamps)) < 0.01] = np.nan
+        data[f"Road_{i}"] = values
+    return pd.DataFrame(data)
+
+
+def scan_summary(store, road_id, start, end):
+    """Reference answer straight from the rows"""
+    lo, hi = store.slice_range(start, end)
+    values = np.asarray(store.column(road_id)[lo:hi])
+    present = ~np.isnan(values)
+    if not present.any():
+        return {"count": 0}
+    return {
+        "count": int(present.sum()),
+        "mean": float(np.nanmean(values)),
+        "variance": float(np.nanvar(values, ddof=1)) if present.sum() > 1 else float("nan"),
+        "min": float(np.nanmin(values)),
+        "max": float(np.nanmax(values)),
+        "min_timestamp": store.timestamp_at(lo + int(np.nanargmin(values))),
+        "max_timestamp": store.timestamp_at(lo + int(np.nanargmax(values))),
+    }
+
+
+def matches(expected, actual):
+    if expected["count"] != actual["count"]:
+        return False
+    if not expected["count"]:
+        return True
+    for field in ("min", "max", "min_timestamp", "max_timestamp"):
+        if expected[field] != actual[field]:
+            return False
+    return all(math.isclose(expected[field], actual[field], rel_tol=1e-9, abs_tol=1e-9)
+               for field in ("mean", "variance") if not math.isnan(expected[field]))
+
+
+def check_half_open(store, rng, queries):
+    """Mismatches of range answers with one bound missing against a scan to the first or latest reading"""
+    first, last = store.first_timestamp(), store.last_timestamp()
+    mismatches = 0
+    for _ in range(queries):
+        road = store.road_ids[rng.integers(len(store.road_ids))]
+        at = (first + (last - first) * rng.random()).floor('s')
+        for bound, start, end in (("start_timestamp", at, last), ("end_timestamp", first, at)):
+            expected = scan_summary(store, road, start, end)
+            query = {"road_id": road, bound: str(at)}
+            peak = answer(store, {"action": "retrieve_max_water_level_in_range", **query})
+            average = answer(store, {"action": "retrieve_average_water_level_in_range", **query})
+            if (peak.get("level") != expected.get("max") or average.get("count") != expected["count"] or
+                    peak.get("timestamp") != str(expected.get("max_timestamp"))):
+                mismatches += 1
+                print(f"MISMATCH [{bound} only] {road} {at}\n  scan: {expected}\n  engine: {peak}, {average}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark range summaries over short and long windows")
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--roads", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200, help="random windows per window size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    store = store_from_frame(synthetic_frame(args.years, args.roads, args.seed))
+    print(f"{len(store)} hourly rows x {len(store.road_ids)} roads")
+
+    # Build every index up front so only query latency is timed
+    for index, build in (("rollup", lambda road: [store.rollups(road)]),
+                         ("sparse", lambda road: [store.prefix_aggregates(road), store.extremum_index(road, 'min'),
+                                                  store.extremum_index(road, 'max')])):
+        start = time.perf_counter()
+        nbytes = sum(part.nbytes() for road in store.road_ids for part in build(road))
+        print(f"built {index} indexes in {time.perf_counter() - start:.2f} s, "
+              f"{nbytes / len(store.road_ids) / 1024:.0f} KiB per road")
+
+    rng = np.random.default_rng(args.seed)
+    first, last = store.first_timestamp(), store.last_timestamp()
+    mismatches = 0
+    print(f"\n{'window':<7} {'scan ms':>9} {'rollup ms':>10} {'sparse ms':>10}")
+    for name, width in WINDOWS.items():
+        if width > last - first:
+            print(f"{name:<7} skipped: longer than the data")
+            continue
+        latencies = {"scan": [], "rollup": [], "sparse": []}
+        for _ in range(args.queries):
+            road = store.road_ids[rng.integers(len(store.road_ids))]
+            # Random, unaligned start so the planner has raw edges to deal with
+            slack = (last - first - width) // pd.Timedelta(minutes=1)
+            start = first + pd.Timedelta(minutes=int(rng.integers(0, slack + 1)))
+            end = start + width
+            results = {}
+            for method in latencies:
+                began = time.perf_counter()
+                if method == "scan":
+                    results[method] = scan_summary(store, road, start, end)
+                else:
+                    results[method] = store.range_summary(road, start, end, index=method)
+                latencies[method].append((time.perf_counter() - began) * 1000)
+            for method in ("rollup", "sparse"):
+                if not matches(results["scan"], results[method]):
+                    mismatches += 1
+                    print(f"MISMATCH [{method}] {road} {start} .. {end}\n  scan: {results['scan']}\n"
+                          f"  {method}: {results[method]}")
+        scan, rollup, sparse = (statistics.median(latencies[method]) for method in ("scan", "rollup", "sparse"))
+        print(f"{name:<7} {scan:>9.3f} {rollup:>10.3f} {sparse:>10.3f}")
+
+    mismatches += check_half_open(store, rng, args.queries)
+    print(f"\nExactness: {mismatches} mismatches against a scan of the rows")
+    print(f"Default index behind range_summary: {water_store.RANGE_INDEX}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
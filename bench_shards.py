@@ -0,0 +1,112 @@
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_rollups import synthetic_frame
+from water_cross import roads_above, top_roads
+from water_shards import ShardedStore, partition_csv
+from water_store import store_from_frame
+
+# Multi-year range summaries and cross-road queries answered from monthly
+# shards, in-process and with a process pool, checked against one store
+# holding the whole history.
+
+
+def close(expected, actual):
+    if isinstance(expected, float) and math.isnan(expected):
+        return isinstance(actual, float) and math.isnan(actual)
+    if isinstance(expected, float):
+        return math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-9)
+    return expected == actual
+
+
+def matches_summary(expected, actual):
+    exact = ('rows', 'count', 'min', 'max', 'first', 'last',
+             'min_timestamp', 'max_timestamp', 'first_timestamp', 'last_timestamp')
+    return (all(close(expected[field], actual[field]) if field in ('min', 'max', 'first', 'last')
+                else expected[field] == actual[field] for field in exact) and
+            all(close(expected[field], actual[field]) for field in ('sum', 'mean', 'variance')))
+
+
+def matches_roads(expected, actual, store):
+    """Cross-road results, with the single store's row positions turned into timestamps"""
+    if len(expected) != len(actual):
+        return False
+    for (road, level, row), (shard_road, shard_level, timestamp) in zip(expected, actual):
+        if road != shard_road or not close(level, shard_level):
+            return False
+        if row is not None and store.timestamp_at(row) != timestamp:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark monthly shards against one whole-history store")
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--roads", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.years, args.roads, args.seed)
+    store = store_from_frame(df)
+    rng = np.random.default_rng(args.seed)
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "levels.csv")
+        df.to_csv(csv_path, index=False)
+        began = time.perf_counter()
+        directory = partition_csv(csv_path)
+        print(f"{len(store)} hourly rows x {args.roads} roads partitioned in {time.perf_counter() - began:.1f} s")
+
+        with ShardedStore(directory, workers=1) as serial, ShardedStore(directory, workers=args.workers) as pooled:
+            print(f"{len(serial.shards)} shards; pool of {pooled.workers} workers (this machine has "
+                  f"{os.cpu_count()} cores)")
+            first, last = store.first_timestamp(), store.last_timestamp()
+            latencies = {"single store": [], "shards, 1 process": [], "shards, pool": []}
+            for _ in range(args.queries):
+                road = store.road_ids[rng.integers(len(store.road_ids))]
+                start = first + (last - first) * rng.random() / 4
+                end = last - (last - first) * rng.random() / 4
+                threshold = float(rng.uniform(3.5, 5.5))
+                questions = (
+                    ("summary", lambda source: source.range_summary(road, start, end)
+                     if source is not store else store.range_summary(road, start, end, index="rollup")),
+                    ("above", lambda source: source.roads_above(threshold, start=start, end=end)
+                     if source is not store else roads_above(store, threshold, start=start, end=end)),
+                    ("top max", lambda source: source.top_roads(10, 'max', start, end)
+                     if source is not store else top_roads(store, 10, 'max', start, end)),
+                    ("top mean", lambda source: source.top_roads(10, 'mean', start, end)
+                     if source is not store else top_roads(store, 10, 'mean', start, end)),
+                )
+                for name, question in questions:
+                    results = {}
+                    for label, source in zip(latencies, (store, serial, pooled)):
+                        began = time.perf_counter()
+                        results[label] = question(source)
+                        latencies[label].append((time.perf_counter() - began) * 1000)
+                    expected = results["single store"]
+                    for label in ("shards, 1 process", "shards, pool"):
+                        ok = (matches_summary(expected, results[label]) if name == "summary"
+                              else matches_roads(expected, results[label], store))
+                        if not ok:
+                            mismatches += 1
+                            print(f"MISMATCH [{label}] {name} {road} {start} .. {end}\n  store:  {expected}\n"
+                                  f"  shards: {results[label]}")
+            print(f"\n{'median ms per query':<20}")
+            for label, values in latencies.items():
+                print(f"  {label:<18} {statistics.median(values):8.1f}")
+
+    print(f"\nExactness: {mismatches} mismatches against the single store")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,13 @@
 import pandas as pd
 import json
+import sys
 import re
 from datetime import datetime
+from water_engine import stream_answer
+from water_store import ASOF_TOLERANCE, load_store
 
-# Load the CSV file containing water level data
-df = pd.read_csv('road_water_levels.csv', parse_dates=['Timestamp'])
+# Load the water level data, using the columnar copy when one has been converted
+store = load_store('road_water_levels.csv')
 
 # Function to generate structured output from the natural language queryw
 def generate_structured_query(query):
@@ -40,8 +43,11 @@ def execute_query(structured_query):
         query_data = json.loads(structured_query)
         road_id = query_data.get("road_id")
 
-        if not road_id or road_id not in df.columns:
-            return f"Error: Invalid or missing road ID. Available roads are: {', '.join([col for col in df.columns if col.startswith('Road_')])}"
+        if not road_id or not store.has_road(road_id):
+            return f"Error: Invalid or missing road ID. Available roads are: {', '.join(store.road_ids)}"
+
+        # Only the requested road's column is paged in
+        df = store.frame(road_id)
 
         if query_data.get("action") == "retrieve_max_water_level":
             max_level = df[road_id].max()
@@ -53,9 +59,13 @@ def execute_query(structured_query):
                 return "Error: No timestamp provided for the water level query."
             try:
                 timestamp = pd.to_datetime(timestamp)
-                row = df[df['Timestamp'] == timestamp]
-                if not row.empty:
-                    water_level = row[road_id].values[0]
+                position = store.locate(timestamp, match=query_data.get("match", "exact"),
+                                        tolerance=query_data.get("tolerance", ASOF_TOLERANCE))
+                if position is not None:
+                    water_level = store.column(road_id)[position]
+                    reading_time = store.timestamp_at(position)
+                    if reading_time != timestamp:
+                        return f"Water level on {road_id} at {reading_time} (closest reading to {timestamp}) was {water_level} meters."
                     return f"Water level on {road_id} at {timestamp} was {water_level} meters."
                 else:
                     return f"No data available for {road_id} at the specified time: {timestamp}. Available timestamps are: {', '.join(df['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist())}"
@@ -63,8 +73,8 @@ def execute_query(structured_query):
                 return f"Error: Invalid timestamp format. Please use YYYY-MM-DD HH:MM:SS."
         
         elif query_data.get("action") == "retrieve_all_water_levels":
-            levels = df[['Timestamp', road_id]]
-            return levels.to_string(index=False)
+            # A lazy stream of text blocks, so long histories are never held as one string
+            return stream_answer(store, query_data)
         
         else:
             return "I'm sorry, I couldn't understand your query. Please try rephrasing it."
@@ -77,8 +87,8 @@ def execute_query(structured_query):
 # Main loop to take user queries and process them
 if __name__ == "__main__":
     print("Welcome! Ask me anything about the water levels on different roads.")
-    print("Available roads are:", ", ".join([col for col in df.columns if col.startswith('Road_')]))
-    print("Available timestamps are:", ", ".join(df['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()))
+    print("Available roads are:", ", ".join(store.road_ids))
+    print("Available timestamps are:", ", ".join(store.timestamp_index().strftime('%Y-%m-%d %H:%M:%S').tolist()))
     print("Type 'exit' to stop.")
     
     while True:
@@ -92,4 +102,7 @@ if __name__ == "__main__":
         
         # Execute the structured query and print the result
         result = execute_query(structured_query)
-        print(result)
\ No newline at end of file
+        if isinstance(result, str):
+            print(result)
+        else:
+            sys.stdout.writelines(result)
\ No newline at end of file
@@ -1,67 +1,21 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import pandas as pd
 import json
-import torch
-import re
+import sys
+import query_parser
+from water_engine import stream_answer
+from water_store import ASOF_TOLERANCE, load_store
 
 
-# Load the CSV file containing water level data
-df = pd.read_csv('road_water_levels_large.csv', parse_dates=['Timestamp'])
+# Load the water level data, using the columnar copy when one has been converted
+store = load_store('road_water_levels_large.csv')
 
-# Load a pre-trained model and tokenizer from Hugging Face
-model_name = "google/flan-t5-small"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+# Actions execute_query below knows how to answer
+SUPPORTED_ACTIONS = {"retrieve_max_water_level", "retrieve_water_level", "retrieve_all_water_levels"}
 
 # Function to generate structured output from the natural language query
 def generate_structured_query(query):
-    prompt = (
-        "You are an assistant that converts questions about water levels into a structured JSON format."
-        " The output must be a complete JSON object enclosed in curly braces {}."
-        " The JSON object should include the following keys: 'action', 'road_id', and 'timestamp' (optional)."
-        " The road_id should always start with 'Road_' followed by the exact road number from the query."
-        " Handle potential spelling mistakes in the query."
-        "\nHere are some examples of questions and their expected outputs:\n"
-        "- Question: What is the higest water level on road 101?\n"
-        "  Output: {\"action\": \"retrieve_max_water_level\", \"road_id\": \"Road_101\"}\n"
-        "- Question: What was the water levl on road 102 at 2024-10-15 08:00:00?\n"
-        "  Output: {\"action\": \"retrieve_water_level\", \"road_id\": \"Road_102\", \"timestamp\": \"2024-10-15 08:00:00\"}\n"
-        "- Question: What are all the water levels on road 103?\n"
-        "  Output: {\"action\": \"retrieve_all_water_levels\", \"road_id\": \"Road_103\"}\n"
-        f"\nQuestion: {query}\n"
-        "Output (just JSON): "
-    )
-    
-    inputs = tokenizer(prompt, return_tensors="pt", padding=True, truncation=True, max_length=512)
-    
-    with torch.no_grad():
-        outputs = model.generate(**inputs, max_new_tokens=100)
-    
-    structured_query = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    # Debugging: Print the generated structured query
-    print(f"Generated structured query: {structured_query}")
-    
-    # Ensure the output is enclosed in curly braces
-    if not structured_query.startswith("{"):
-        structured_query = "{" + structured_query
-    if not structured_query.endswith("}"):
-        structured_query = structured_query + "}"
-    
-    # Post-process to correct road number if necessary
-    try:
-        query_data = json.loads(structured_query)
-        road_match = re.search(r'road\s*(\d+)', query, re.IGNORECASE)
-        if road_match:
-            correct_road_id = f"Road_{road_match.group(1)}"
-            if query_data["road_id"] != correct_road_id:
-                query_data["road_id"] = correct_road_id
-                structured_query = json.dumps(query_data)
-                print(f"Corrected structured query: {structured_query}")
-    except json.JSONDecodeError:
-        pass  # If JSON parsing fails, we'll handle it in the execute_query function
-    
-    return structured_query
+    # Keyword rules first; flan-t5 is only loaded for queries they can't parse
+    return query_parser.generate_structured_query(query, actions=SUPPORTED_ACTIONS)
 
 # Function to execute the structured query on the CSV data
 def execute_query(structured_query):
@@ -70,8 +24,11 @@ def execute_query(structured_query):
         query_data = json.loads(structured_query)
 
         road_id = query_data.get("road_id")
-        if not road_id or road_id not in df.columns:
-            return f"Error: Invalid or missing road ID. Available roads are: {', '.join([col for col in df.columns if col.startswith('Road_')])}"
+        if not road_id or not store.has_road(road_id):
+            return f"Error: Invalid or missing road ID. Available roads are: {', '.join(store.road_ids)}"
+
+        # Only the requested road's column is paged in
+        df = store.frame(road_id)
 
         if query_data.get("action") == "retrieve_max_water_level":
             max_level = df[road_id].max()
@@ -83,9 +40,13 @@ def execute_query(structured_query):
                 return "Error: No timestamp provided for the water level query."
             try:
                 timestamp = pd.to_datetime(timestamp)
-                row = df[df['Timestamp'] == timestamp]
-                if not row.empty:
-                    water_level = row[road_id].values[0]
+                position = store.locate(timestamp, match=query_data.get("match", "exact"),
+                                        tolerance=query_data.get("tolerance", ASOF_TOLERANCE))
+                if position is not None:
+                    water_level = store.column(road_id)[position]
+                    reading_time = store.timestamp_at(position)
+                    if reading_time != timestamp:
+                        return f"Water level on {road_id} at {reading_time} (closest reading to {timestamp}) was {water_level} meters."
                     return f"Water level on {road_id} at {timestamp} was {water_level} meters."
                 else:
                     return f"No data available for {road_id} at the specified time: {timestamp}. Available timestamps are: {', '.join(df['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist())}"
@@ -93,8 +54,8 @@ def execute_query(structured_query):
                 return f"Error: Invalid timestamp format. Please use YYYY-MM-DD HH:MM:SS."
         
         elif query_data.get("action") == "retrieve_all_water_levels":
-            levels = df[['Timestamp', road_id]]
-            return levels.to_string(index=False)
+            # A lazy stream of text blocks, so long histories are never held as one string
+            return stream_answer(store, query_data)
         
         else:
             return "I'm sorry, I couldn't understand your query. Please try rephrasing it."
@@ -113,18 +74,20 @@ if __name__ == "__main__":
     print("- What are all the water levels on road 103?")
     # print("Available roads are:", ", ".join([col for col in df.columns if col.startswith('Road_')]))
     # print("Available timestamps are:", ", ".join(df['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()))
-    road_columns = [col for col in df.columns if col.startswith('Road_')]
+    road_columns = store.road_ids
     print("Available roads range from:", road_columns[0], "to", road_columns[-1])
 
 # Displaying only the start and end of the timestamps
-    print("Available timestamps range from:", df['Timestamp'].min().strftime('%Y-%m-%d %H:%M:%S'), 
-      "to", df['Timestamp'].max().strftime('%Y-%m-%d %H:%M:%S'))
+    print("Available timestamps range from:", store.first_timestamp().strftime('%Y-%m-%d %H:%M:%S'), 
+      "to", store.last_timestamp().strftime('%Y-%m-%d %H:%M:%S'))
 
     print("Type 'exit' to stop.")
     
     while True:
         query = input("Enter your query: ")
         if query.lower() == "exit":
+            stats = query_parser.parse_cache.stats()
+            print(f"Parse cache: {stats['hits']} hits, {stats['misses']} misses")
             print("Goodbye!")
             break
         
@@ -133,4 +96,7 @@ if __name__ == "__main__":
         
         # Execute the structured query and print the result
         result = execute_query(structured_query)
-        print(result)
\ No newline at end of file
+        if isinstance(result, str):
+            print(result)
+        else:
+            sys.stdout.writelines(result)
\ No newline at end of file
@@ -1,18 +1,274 @@
-import pandas as pd
+import argparse
+import json
+import os
+import sys
+import time
+
 import numpy as np
+import pandas as pd
+
+from water_index import RoadSummaries
+from water_store import (MANIFEST_FILE, QUANTIZED_DTYPE, SUMMARY_FILE, TIMESTAMP_FILE, QuantizedColumn,
+                         columnar_path, quantize)
+
+# Synthetic water levels at benchmark scale. Readings are generated on a fixed
+# grid of BLOCK_ROWS x BLOCK_ROADS blocks, each from its own seeded RNG, so any
+# block can be produced on its own and the CSV (written a row chunk at a time)
+# and the columnar store (written a road block at a time) hold the same values
+# for a given seed. Memory stays at one row chunk across all roads.
+#
+# Each road has a base level, a seasonal and a daily cycle and sensor noise.
+# Regional storms raise many roads at once, with a lag and a response of their
+# own; local events hit one road. A flood event rises over a few hours and
+# recedes exponentially. Readings go missing at random and in sensor outages.
+# Levels are rounded to millimetres, so quantized columns store them exactly.
+
+BLOCK_ROWS = 1024
+BLOCK_ROADS = 64
+# Default size: 100 roads, hourly, 2024-10-01 to 2024-10-15, the original dataset
+ROADS = 100
+START = "2024-10-01"
+END = "2024-10-15"
+FREQ = "h"
+OUTPUT = "road_water_levels_large.csv"
+MISSING_RATE = 0.002
+# Events per year
+STORM_RATE = 12
+LOCAL_EVENT_RATE = 4
+OUTAGE_RATE = 2
+# Share of roads a storm reaches
+STORM_REACH = 0.35
+HOUR_NS = 3_600_000_000_000
+YEAR_HOURS = 365.25 * 24
+MAX_LEVEL = 30.0
+# Readings held at once when summarizing the columnar store
+SUMMARY_CELLS = 8_000_000
+
+
+def step_ns(freq):
+    """Sampling interval in nanoseconds; only fixed frequencies make sense for readings"""
+    try:
+        return pd.tseries.frequencies.to_offset(freq).nanos
+    except ValueError:
+        raise ValueError(f"Sampling frequency must be a fixed interval, not {freq!r}")
+
+
+class Generator:
+    """Seeded synthetic readings for roads x timestamps, produced block by block"""
+
+    def __init__(self, roads=ROADS, start=START, end=END, freq=FREQ, missing_rate=MISSING_RATE, seed=0,
+                 storm_rate=STORM_RATE, local_event_rate=LOCAL_EVENT_RATE, outage_rate=OUTAGE_RATE):
+        self.road_ids = [f"Road_{i}" for i in range(1, roads + 1)]
+        self.start = pd.Timestamp(start).as_unit('ns').value
+        self.step = step_ns(freq)
+        self.rows = max(0, (pd.Timestamp(end).as_unit('ns').value - self.start) // self.step + 1)
+        self.missing_rate = missing_rate
+        self.seed = seed
+        self.local_event_rate = local_event_rate
+        self.outage_rate = outage_rate
+        self.hours = self.rows * self.step / HOUR_NS
+
+        rng = np.random.default_rng([seed, 0])
+        storms = rng.poisson(storm_rate * self.hours / YEAR_HOURS)
+        self.storm_onset = rng.uniform(-48, self.hours, storms)
+        self.storm_intensity = rng.gamma(3.0, 0.8, storms)
+        self._roads = {}
+
+    def __len__(self):
+        return self.rows
+
+    def timestamps(self, lo, hi):
+        """int64 epoch nanoseconds of rows [lo, hi)"""
+        return self.start + np.arange(lo, hi, dtype=np.int64) * self.step
+
+    def _road_block(self, block):
+        """Per-road parameters, flood events and outages for one block of roads"""
+        params = self._roads.get(block)
+        if params is not None:
+            return params
+        rng = np.random.default_rng([self.seed, 1, block])
+        n = len(self.road_ids[block * BLOCK_ROADS:(block + 1) * BLOCK_ROADS])
+        params = {
+            'base': rng.uniform(0.5, 2.0, n),
+            'seasonal': rng.uniform(0.1, 0.6, n),
+            'phase': rng.uniform(0, 2 * np.pi, n),
+            'daily': rng.uniform(0.0, 0.1, n),
+            'noise': rng.uniform(0.02, 0.08, n),
+            'events': [],
+            'outages': [],
+        }
+        years = self.hours / YEAR_HOURS
+        sensitivity = rng.lognormal(0.0, 0.4, n)
+        for j in range(n):
+            # (onset hour, rise hours, recession hours, peak metres) for every event on this road
+            reached = rng.random(len(self.storm_onset)) < STORM_REACH
+            local = rng.poisson(self.local_event_rate * years)
+            onset = np.concatenate([self.storm_onset[reached] + rng.uniform(0, 6, reached.sum()),
+                                    rng.uniform(-48, self.hours, local)])
+            peak = np.concatenate([self.storm_intensity[reached] * sensitivity[j], rng.gamma(2.0, 0.8, local)])
+            rise = rng.uniform(2, 12, len(onset))
+            recession = rng.uniform(6, 48, len(onset))
+            params['events'].append(np.column_stack([onset, rise, recession, peak]))
+            outages = rng.poisson(self.outage_rate * years)
+            outage_start = rng.uniform(0, self.hours, outages)
+            params['outages'].append(np.column_stack([outage_start, outage_start + rng.exponential(12, outages)]))
+        self._roads[block] = params
+        return params
+
+    def block(self, row_block, road_block):
+        """Readings of one grid block, rows x roads, with NaN for missing readings"""
+        lo, hi = row_block * BLOCK_ROWS, min((row_block + 1) * BLOCK_ROWS, self.rows)
+        params = self._road_block(road_block)
+        rng = np.random.default_rng([self.seed, 2, row_block, road_block])
+        hours = ((self.timestamps(lo, hi) - self.start) / HOUR_NS)[:, None]
+        n = len(params['base'])
+
+        levels = (params['base'] + params['seasonal'] * np.sin(2 * np.pi * hours / YEAR_HOURS + params['phase'])
+                  + params['daily'] * np.sin(2 * np.pi * hours / 24 + params['phase'])
+                  + rng.normal(0.0, 1.0, (hi - lo, n)) * params['noise'])
+        first, last = hours[0, 0], hours[-1, 0]
+        for j in range(n):
+            events = params['events'][j]
+            # Events fade out six recession times after the peak
+            live = events[(events[:, 0] <= last) & (events[:, 0] + events[:, 1] + 6 * events[:, 2] >= first)]
+            for onset, rise, recession, peak in live:
+                since = hours[:, 0] - onset
+                rising = (since >= 0) & (since < rise)
+                falling = since >= rise
+                levels[rising, j] += peak * (1 - np.cos(np.pi * since[rising] / rise)) / 2
+                levels[falling, j] += peak * np.exp(-(since[falling] - rise) / recession)
+        levels = np.round(np.clip(levels, 0.0, MAX_LEVEL), 3)
+
+        levels[rng.random(levels.shape) < self.missing_rate] = np.nan
+        for j in range(n):
+            for begin, end in params['outages'][j]:
+                levels[(hours[:, 0] >= begin) & (hours[:, 0] < end), j] = np.nan
+        return levels
+
+    def row_chunks(self):
+        """(lo, hi, readings for all roads) a block of rows at a time"""
+        road_blocks = range((len(self.road_ids) + BLOCK_ROADS - 1) // BLOCK_ROADS)
+        for row_block in range((self.rows + BLOCK_ROWS - 1) // BLOCK_ROWS):
+            lo = row_block * BLOCK_ROWS
+            hi = min(lo + BLOCK_ROWS, self.rows)
+            yield lo, hi, np.hstack([self.block(row_block, road_block) for road_block in road_blocks])
+
+    def column_blocks(self):
+        """(road ids, lo, hi, readings) for each block of roads, a block of rows at a time"""
+        for road_block in range((len(self.road_ids) + BLOCK_ROADS - 1) // BLOCK_ROADS):
+            roads = self.road_ids[road_block * BLOCK_ROADS:(road_block + 1) * BLOCK_ROADS]
+            for row_block in range((self.rows + BLOCK_ROWS - 1) // BLOCK_ROWS):
+                lo = row_block * BLOCK_ROWS
+                yield roads, lo, min(lo + BLOCK_ROWS, self.rows), self.block(row_block, road_block)
+
+
+def write_csv(generator, path):
+    """Write the wide CSV a row chunk at a time"""
+    with open(path, 'w', newline='') as f:
+        for lo, hi, levels in generator.row_chunks():
+            df = pd.DataFrame(levels, columns=generator.road_ids)
+            df.insert(0, 'Timestamp', pd.DatetimeIndex(generator.timestamps(lo, hi).view('datetime64[ns]')))
+            df.to_csv(f, header=lo == 0, index=False, date_format='%Y-%m-%d %H:%M:%S', float_format='%.3f')
+    return path
+
+
+def write_columnar(generator, out_dir, source=None, quantize_roads=False):
+    """Write the columnar store load_store opens, a block of roads at a time
+
+    Readings are millimetres below MAX_LEVEL, so with quantize_roads every
+    road is stored as int16 codes with three decimals.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_file = os.path.join(out_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    timestamps = np.lib.format.open_memmap(os.path.join(out_dir, TIMESTAMP_FILE), mode='w+', dtype=np.int64,
+                                           shape=(len(generator),))
+    for lo in range(0, len(generator), BLOCK_ROWS):
+        hi = min(lo + BLOCK_ROWS, len(generator))
+        timestamps[lo:hi] = generator.timestamps(lo, hi)
+    timestamps.flush()
+    del timestamps
+
+    encoding = {road: 3 for road in generator.road_ids} if quantize_roads else {}
+    columns = {}
+    for roads, lo, hi, levels in generator.column_blocks():
+        if lo == 0:
+            for values in columns.values():
+                values.flush()
+            columns = {road: np.lib.format.open_memmap(
+                os.path.join(out_dir, f"{road}.npy"), mode='w+',
+                dtype=QUANTIZED_DTYPE if quantize_roads else np.float64, shape=(len(generator),)) for road in roads}
+        for j, road in enumerate(roads):
+            columns[road][lo:hi] = quantize(levels[:, j], 3) if quantize_roads else levels[:, j]
+    for values in columns.values():
+        values.flush()
+    del columns
+
+    def load_column(road):
+        values = np.load(os.path.join(out_dir, f"{road}.npy"), mmap_mode='r')
+        return QuantizedColumn(values, encoding[road]) if road in encoding else values
+
+    RoadSummaries.from_columns(generator.road_ids, load_column,
+                               block_roads=max(1, SUMMARY_CELLS // max(len(generator), 1))
+                               ).save(os.path.join(out_dir, SUMMARY_FILE))
+
+    # Manifest goes last so a half-written store is never picked up by load_store
+    manifest = {
+        'rows': len(generator),
+        'roads': generator.road_ids,
+        'source': os.path.basename(source) if source else None,
+        'source_mtime': os.path.getmtime(source) if source and os.path.exists(source) else None,
+        'encoding': encoding,
+    }
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f)
+    return out_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic road water levels at benchmark scale")
+    parser.add_argument("--output", default=OUTPUT, help="CSV path; the columnar store goes beside it")
+    parser.add_argument("--roads", type=int, default=ROADS)
+    parser.add_argument("--scale", type=int, default=1, help="multiply the number of roads, e.g. 10 or 100")
+    parser.add_argument("--start", default=START)
+    parser.add_argument("--end", default=END)
+    parser.add_argument("--years", type=float, help="span from --start, instead of --end")
+    parser.add_argument("--freq", default=FREQ, help="sampling interval, e.g. h, 15min, 5min")
+    parser.add_argument("--missing-rate", type=float, default=MISSING_RATE,
+                        help="share of readings dropped at random, besides sensor outages")
+    parser.add_argument("--storm-rate", type=float, default=STORM_RATE, help="regional storms per year")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=("csv", "columnar", "both"), default="both")
+    parser.add_argument("--quantize", action="store_true", help="store columnar readings as int16 millimetres")
+    args = parser.parse_args()
+    if args.format == "columnar" and os.path.exists(args.output):
+        # A columnar store alone records no source mtime, so load_store would take it as stale and read the CSV
+        parser.error(f"{args.output} exists and would shadow a columnar-only store; "
+                     f"use --format both to regenerate it, or remove it first")
 
-# Generate timestamps (one per hour over a period)
-timestamps = pd.date_range(start="2024-10-01", end="2024-10-15", freq='H')
+    end = args.end
+    if args.years is not None:
+        end = pd.Timestamp(args.start) + pd.Timedelta(days=365.25 * args.years) - pd.Timedelta(step_ns(args.freq))
+    generator = Generator(args.roads * args.scale, args.start, end, args.freq, args.missing_rate, args.seed,
+                          storm_rate=args.storm_rate)
+    print(f"{len(generator)} rows x {len(generator.road_ids)} roads "
+          f"({len(generator) * len(generator.road_ids):,} readings)")
 
-# Generate water level data for 100 roads
-data = {'Timestamp': timestamps}
-for i in range(1, 101):
-    road_id = f"Road_{i}"
-    data[road_id] = np.round(np.random.uniform(0, 5, size=len(timestamps)), 3)
- # Random water levels between 0 and 5 meters
+    if args.format in ("csv", "both"):
+        began = time.perf_counter()
+        write_csv(generator, args.output)
+        print(f"Wrote {args.output} in {time.perf_counter() - began:.1f} s")
+    if args.format in ("columnar", "both"):
+        began = time.perf_counter()
+        # The CSV is written first, so the store records its mtime and load_store trusts it; a store
+        # written alone is only used while no CSV sits at --output
+        source = args.output if args.format == "both" else None
+        out_dir = write_columnar(generator, columnar_path(args.output), source, args.quantize)
+        print(f"Wrote {out_dir} in {time.perf_counter() - began:.1f} s")
+    return 0
 
-# Create the DataFrame
-df = pd.DataFrame(data)
 
-# Save to CSV
-df.to_csv('road_water_levels_large.csv', index=False)
+if __name__ == "__main__":
+    sys.exit(main())
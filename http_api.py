@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import code5
+import query_parser
+from query_plan import QueryPlan
+from water_engine import answer, format_answer, stream_answer
+
+# Local HTTP/JSON API over the code5 pipeline, written against asyncio streams
+# so it needs nothing outside the standard library. The event loop only moves
+# bytes; parsing and store lookups run on a thread pool, and concurrent queries
+# that fall through to flan-t5 share batched generate calls.
+#
+#   POST /query   {"query": "max on road 7"} or {"structured": {...}}
+#   POST /batch   {"queries": ["...", {...}, ...]}
+#   POST /stream  like /query, plus "format": "ndjson", "csv" or "text"
+#   GET  /health
+#   GET  /stats
+#
+# Add "text": true to a request to also get the sentence the CLI would print.
+# Listings of readings come a page at a time: pass "page_size" and the
+# "next_cursor" of the previous page as "cursor", or use /stream to get every
+# row in one chunked response.
+
+HOST = "127.0.0.1"
+PORT = 8080
+MAX_BODY_BYTES = 1024 * 1024
+MAX_BATCH_QUERIES = 1000
+KEEPALIVE_TIMEOUT = 30
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv", "text": "text/plain; charset=utf-8"}
+
+# Result cache bookkeeping isn't thread-safe; store lookups are cheap next to parsing
+_answer_lock = threading.Lock()
+
+
+class RequestError(Exception):
+    """A request the API rejects, carrying the HTTP status to answer with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_query(item):
+    """Structured query dict for a natural-language string or an already structured query"""
+    if isinstance(item, dict):
+        return item
+    if not isinstance(item, str) or not item.strip():
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Each query must be a non-empty string or a structured object")
+    return query_parser.parse_query(item.strip())
+
+
+def run_query(item, text=False, page=None):
+    """Parse and answer one query, returning the JSON response body for it"""
+    try:
+        query_data = parse_query(item)
+        if page:
+            query_data = {**query_data, **page}
+        plan = QueryPlan.from_dict(query_data)
+        with _answer_lock:
+            result = answer(code5.store, plan, code5.result_cache)
+    except RequestError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Error processing query: {str(e)}"}
+    response = {"structured": query_data, "result": result}
+    if text:
+        response["text"] = format_answer(result)
+    return response
+
+
+def stats():
+    worker = query_parser._t5_worker
+    return {
+        "rows": len(code5.store),
+        "roads": len(code5.store.road_ids),
+        "store_version": code5.store.version,
+        "parse_cache": query_parser.parse_cache.stats(),
+        "result_cache": code5.result_cache.stats(),
+        "t5_batches": worker.batches if worker else 0,
+        "t5_queries": worker.queries if worker else 0,
+    }
+
+
+class StreamingResponse:
+    """Response body produced block by block and sent with chunked transfer encoding"""
+
+    def __init__(self, blocks, content_type):
+        self.blocks = blocks
+        self.content_type = content_type
+
+
+class QueryAPI:
+    """asyncio HTTP/1.1 server with keep-alive, answering JSON requests from a thread pool"""
+
+    def __init__(self, host=HOST, port=PORT, threads=None):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=threads or min(32, (os.cpu_count() or 1) + 4),
+                                           thread_name_prefix="query")
+        self.server = None
+
+    async def start(self):
+        query_parser.enable_batching()
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        server = self.server or await self.start()
+        async with server:
+            await server.serve_forever()
+
+    async def _query(self, item, text, page=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, run_query, item, text, page)
+
+    async def handle(self, method, path, body):
+        """Route one request, returning (status, JSON-serializable body)"""
+        if path == "/health":
+            if method != "GET":
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return HTTPStatus.OK, {"status": "ok"}
+        if path == "/stats":
+            if method != "GET":
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return HTTPStatus.OK, stats()
+        if path not in ("/query", "/batch", "/stream"):
+            raise RequestError(HTTPStatus.NOT_FOUND, f"No such endpoint: {path}")
+        if method != "POST":
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST")
+
+        try:
+            request = json.loads(body or b"null")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Request body must be JSON")
+        if not isinstance(request, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+        text = bool(request.get("text"))
+        page = {field: request[field] for field in ("page_size", "cursor") if field in request}
+
+        if path in ("/query", "/stream"):
+            item = request.get("structured", request.get("query"))
+            if item is None:
+                raise RequestError(HTTPStatus.BAD_REQUEST, "Give either 'query' or 'structured'")
+            if path == "/query":
+                return HTTPStatus.OK, await self._query(item, text, page)
+            fmt = request.get("format", "ndjson")
+            if fmt not in CONTENT_TYPES:
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown format: {fmt}")
+            try:
+                query_data = await asyncio.get_running_loop().run_in_executor(self.executor, parse_query, item)
+            except RequestError:
+                raise
+            except Exception as e:
+                # e.g. flan-t5 failing to load; answered like /query reports it, not a dropped connection
+                raise RequestError(HTTPStatus.INTERNAL_SERVER_ERROR, f"Error processing query: {str(e)}")
+            try:
+                plan = QueryPlan.from_dict(query_data)
+            except (TypeError, ValueError) as e:
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid structured query: {str(e)}")
+            # Streamed answers skip the result cache, which holds pages, not whole listings
+            return HTTPStatus.OK, StreamingResponse(stream_answer(code5.store, plan, fmt), CONTENT_TYPES[fmt])
+
+        queries = request.get("queries")
+        if not isinstance(queries, list):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "'queries' must be a list")
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f"A batch holds at most {MAX_BATCH_QUERIES} queries")
+        # Submitted together, so queries needing flan-t5 land in the same micro-batches
+        results = await asyncio.gather(*(self._query(item, text, page) for item in queries))
+        return HTTPStatus.OK, {"results": results}
+
+    async def _read_request(self, reader):
+        request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+        if not request_line:
+            return None
+        try:
+            method, path, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length < 0 or length > MAX_BODY_BYTES:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        keep_alive = (headers.get("connection", "").lower() != "close"
+                      if version == "HTTP/1.1" else headers.get("connection", "").lower() == "keep-alive")
+        return method.upper(), path.split("?", 1)[0], body, keep_alive
+
+    async def _stream(self, writer, status, response, keep_alive):
+        """Send a streaming response, formatting each block on the thread pool; False if it broke off"""
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Transfer-Encoding: chunked\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode())
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                block = await loop.run_in_executor(self.executor, next, response.blocks, None)
+            except Exception:
+                # Headers are already sent, so the only way to signal the failure is to drop the connection
+                return False
+            if block is None:
+                break
+            data = block.encode()
+            if not data:
+                continue
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            # Waits while the client is slow, so at most one block is buffered
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, body, keep_alive = request
+                    status, payload = await self.handle(method, path, body)
+                except RequestError as e:
+                    # keep_alive is only set once a request was read whole, so a
+                    # connection that failed mid-request is never reused
+                    status, payload = e.status, {"error": str(e)}
+
+                if isinstance(payload, StreamingResponse):
+                    if not await self._stream(writer, status, payload, keep_alive) or not keep_alive:
+                        break
+                    continue
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve water level queries over a local HTTP/JSON API")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--threads", type=int, default=None, help="threads parsing and answering queries")
+    args = parser.parse_args()
+
+    api = QueryAPI(args.host, args.port, args.threads)
+    print(f"Serving water level queries on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(api.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+import atexit
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+import t5_inference
+from query_plan import QueryPlan
+
+# Tiered natural-language parsing: the rule-based parser answers every query it
+# fully understands, and flan-t5 is only imported and loaded for the rest.
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_PATTERN = r'\d{4}-\d{2}-\d{2}(?:\s+\d{2}:\d{2}:\d{2})?'
+ROAD_PATTERN = r'road\s*(\d+)'
+PARSE_CACHE_SIZE = 4096
+FUZZY_TIME_WORDS = ('around', 'about', 'nearest', 'closest', 'approximately')
+# The lookahead keeps "over 2024-10-01" from reading as a threshold of 2024
+THRESHOLD_PATTERN = (r'(?:above|over|exceed(?:s|ed|ing)?|greater than|more than|higher than|at least)'
+                     r'\s+(\d+(?:\.\d+)?)(?![\d-])')
+# Named alert levels; water_cross.ALERT_LEVELS gives their heights
+ALERT_LEVEL_PATTERN = r'\b(watch|warning|severe)\s+level\b'
+TOP_K_PATTERN = r'\btop\s+(\d+)'
+# Relative windows, resolved against the latest reading when the query runs
+WINDOW_PATTERN = r'\b(?:this|past|last)\s+(day|week|month)\b|\b(today)\b'
+WINDOWS = {'day': '24h', 'today': '24h', 'week': '7D', 'month': '30D'}
+# Actions over every road at once; they take no road_id
+CROSS_ROAD_ACTIONS = (
+    "retrieve_roads_above_threshold",
+    "retrieve_top_roads",
+    "count_flooded_roads_per_hour",
+)
+# Per-road flood events at an alert level, answered from the event index
+FLOOD_EVENT_ACTIONS = (
+    "retrieve_flood_events",
+    "retrieve_longest_flood",
+    "retrieve_time_above_threshold",
+)
+# Every action the keyword rules can produce; constrained flan-t5 decoding picks from these
+ACTIONS = (
+    "retrieve_water_level",
+    "retrieve_latest_water_level",
+    "retrieve_max_water_level",
+    "retrieve_min_water_level",
+    "retrieve_average_water_level",
+    "retrieve_all_water_levels",
+    "retrieve_all_water_levels_in_range",
+    "retrieve_max_water_level_in_range",
+    "retrieve_min_water_level_in_range",
+    "retrieve_average_water_level_in_range",
+) + CROSS_ROAD_ACTIONS + FLOOD_EVENT_ACTIONS
+# "constrained" decodes only schema-valid queries; "free" lets flan-t5 write the JSON itself
+T5_DECODING = "constrained"
+# Queries per flan-t5 generate call when parsing in bulk
+T5_BATCH_SIZE = 32
+RANGE_ACTIONS = {
+    "retrieve_all_water_levels_in_range",
+    "retrieve_max_water_level_in_range",
+    "retrieve_min_water_level_in_range",
+    "retrieve_average_water_level_in_range",
+}
+
+def extract_road_number(query):
+    """Extract road number from query text"""
+    road_match = re.search(ROAD_PATTERN, query, re.IGNORECASE)
+    return f"Road_{road_match.group(1)}" if road_match else None
+
+
+def determine_query_type(query):
+    """Determine the type of query based on keywords"""
+    query = query.lower()
+    # "roads" in the plural asks about every road, "road 7" about one
+    if re.search(r'\broads\b', query):
+        if 'per hour' in query or 'each hour' in query or 'hourly' in query or 'every hour' in query:
+            return "count_flooded_roads_per_hour"
+        if re.search(r'\btop\b', query) or 'highest' in query or 'most' in query:
+            return "retrieve_top_roads"
+        return "retrieve_roads_above_threshold"
+    if re.search(THRESHOLD_PATTERN, query) or re.search(ALERT_LEVEL_PATTERN, query) or 'flood' in query:
+        if 'longest' in query:
+            return "retrieve_longest_flood"
+        if 'how long' in query or 'how many hours' in query or 'time above' in query or 'total time' in query:
+            return "retrieve_time_above_threshold"
+        return "retrieve_flood_events"
+    if 'average' in query or 'avg' in query or 'mean' in query:
+        if 'between' in query or 'from' in query:
+            return "retrieve_average_water_level_in_range"
+        return "retrieve_average_water_level"
+    elif 'maximum' in query or 'max' in query or 'highest' in query:
+        if 'between' in query or 'from' in query:
+            return "retrieve_max_water_level_in_range"
+        return "retrieve_max_water_level"
+    elif 'minimum' in query or 'min' in query or 'lowest' in query:
+        if 'between' in query or 'from' in query:
+            return "retrieve_min_water_level_in_range"
+        return "retrieve_min_water_level"
+    elif 'latest' in query or 'recent' in query or 'current' in query:
+        return "retrieve_latest_water_level"
+    elif 'between' in query or 'from' in query:
+        return "retrieve_all_water_levels_in_range"
+    elif re.search(r'\ball\b', query):
+        return "retrieve_all_water_levels"
+    return "retrieve_water_level"
+
+
+def extract_threshold(query):
+    """Water level threshold in the query, as a number or a named alert level, or None"""
+    lowered = query.lower()
+    threshold = re.search(THRESHOLD_PATTERN, lowered)
+    if threshold:
+        return float(threshold.group(1))
+    level = re.search(ALERT_LEVEL_PATTERN, lowered)
+    return level.group(1) if level else None
+
+
+def cross_road_query(query, action):
+    """Structured query for a cross-road action, with its threshold, top-k, metric and time span"""
+    lowered = query.lower()
+    structured_query = {"action": action}
+    if action == "retrieve_top_roads":
+        top = re.search(TOP_K_PATTERN, lowered)
+        if top:
+            structured_query["k"] = int(top.group(1))
+        structured_query["metric"] = ("mean" if 'average' in lowered or 'avg' in lowered or 'mean' in lowered
+                                      else "max")
+    elif extract_threshold(query) is not None:
+        structured_query["threshold"] = extract_threshold(query)
+
+    timestamps = re.findall(TIMESTAMP_PATTERN, query)
+    window = re.search(WINDOW_PATTERN, lowered)
+    if len(timestamps) >= 2:
+        structured_query["start_timestamp"] = timestamps[0]
+        structured_query["end_timestamp"] = timestamps[1]
+    elif timestamps and action == "retrieve_roads_above_threshold":
+        structured_query["timestamp"] = timestamps[0]
+        if any(word in lowered for word in FUZZY_TIME_WORDS):
+            structured_query["match"] = "nearest"
+    elif window:
+        structured_query["window"] = WINDOWS[window.group(1) or window.group(2)]
+    return structured_query
+
+
+def parse_rule_based(query, actions=None):
+    """Parse a query with keyword rules, or return None if the rules can't parse it with confidence
+
+    actions limits the result to the actions the caller can execute.
+    """
+    action = determine_query_type(query)
+    if actions is not None and action not in actions:
+        return None
+    if action in CROSS_ROAD_ACTIONS:
+        return cross_road_query(query, action)
+
+    road_id = extract_road_number(query)
+    if not road_id:
+        return None
+
+    structured_query = {
+        "action": action,
+        "road_id": road_id
+    }
+
+    lowered = query.lower()
+    timestamps = re.findall(TIMESTAMP_PATTERN, query)
+    if action in FLOOD_EVENT_ACTIONS:
+        if extract_threshold(query) is not None:
+            structured_query["threshold"] = extract_threshold(query)
+        # Without both ends of a range, events are looked up over the whole record
+        if len(timestamps) >= 2:
+            structured_query["start_timestamp"] = timestamps[0]
+            structured_query["end_timestamp"] = timestamps[1]
+    elif action in RANGE_ACTIONS:
+        # A range question without both ends is not something the rules can settle
+        if len(timestamps) < 2:
+            return None
+        structured_query["start_timestamp"] = timestamps[0]
+        structured_query["end_timestamp"] = timestamps[1]
+    elif timestamps:
+        structured_query["timestamp"] = timestamps[0]
+        # Sensors report slightly off the hour, so let fuzzy wording match the closest reading
+        if any(word in lowered for word in FUZZY_TIME_WORDS):
+            structured_query["match"] = "nearest"
+    elif action == "retrieve_water_level":
+        # No keyword matched and there is no time to look up, e.g. a misspelled "higest"
+        return None
+
+    return structured_query
+
+
+# Set by enable_batching to route flan-t5 calls through a micro-batching worker
+_t5_worker = None
+
+
+def enable_batching(max_batch_size=16, max_wait_ms=10):
+    """Batch concurrent flan-t5 queries into shared generate calls"""
+    global _t5_worker
+    if _t5_worker is None:
+        generate = (t5_inference.generate_constrained_batch if T5_DECODING == "constrained"
+                    else t5_inference.generate_batch)
+        _t5_worker = t5_inference.BatchingWorker(generate, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    return _t5_worker
+
+
+def _run_t5(request, generate):
+    if _t5_worker is not None:
+        return _t5_worker(request)
+    return generate([request])[0]
+
+
+def _constrained_request(query, actions=None):
+    return (query, tuple(sorted(actions or ACTIONS)), extract_road_number(query) is None)
+
+
+def _constrained_query(query, action, road_number):
+    """Structured query around a constrained flan-t5 choice of action and road number"""
+    if action in CROSS_ROAD_ACTIONS:
+        return cross_road_query(query, action)
+
+    road_id = extract_road_number(query)
+    structured_query = {"action": action}
+    if road_id is None and road_number:
+        road_id = f"Road_{road_number}"
+    if road_id:
+        structured_query["road_id"] = road_id
+
+    # Timestamps are copied from the query text rather than generated
+    timestamps = re.findall(TIMESTAMP_PATTERN, query)
+    if action in FLOOD_EVENT_ACTIONS and extract_threshold(query) is not None:
+        structured_query["threshold"] = extract_threshold(query)
+    if (action in RANGE_ACTIONS or action in FLOOD_EVENT_ACTIONS) and len(timestamps) >= 2:
+        structured_query["start_timestamp"] = timestamps[0]
+        structured_query["end_timestamp"] = timestamps[1]
+    elif timestamps and action not in FLOOD_EVENT_ACTIONS:
+        structured_query["timestamp"] = timestamps[0]
+    return structured_query
+
+
+def _free_form_query(query, structured_query):
+    """Repair free-form flan-t5 output into JSON text, correcting the road number from the query"""
+    # Ensure the output is enclosed in curly braces
+    if not structured_query.startswith("{"):
+        structured_query = "{" + structured_query
+    if not structured_query.endswith("}"):
+        structured_query = structured_query + "}"
+
+    # Post-process to correct road number if necessary
+    try:
+        query_data = json.loads(structured_query)
+        correct_road_id = extract_road_number(query)
+        if correct_road_id and query_data.get("road_id") != correct_road_id:
+            query_data["road_id"] = correct_road_id
+            structured_query = json.dumps(query_data)
+            logger.debug("Corrected structured query: %s", structured_query)
+    except json.JSONDecodeError:
+        pass  # If JSON parsing fails, we'll handle it in the execute_query function
+
+    return structured_query
+
+
+def generate_constrained(query, actions=None):
+    """Build a structured query from a constrained flan-t5 choice of action, always valid JSON"""
+    action, road_number = _run_t5(_constrained_request(query, actions), t5_inference.generate_constrained_batch)
+    structured_query = _constrained_query(query, action, road_number)
+    logger.debug("Generated structured query: %s", structured_query)
+    return json.dumps(structured_query)
+
+
+def generate_with_t5(query, actions=None):
+    """Generate a structured query with flan-t5 for queries the rules could not parse"""
+    if T5_DECODING == "constrained":
+        return generate_constrained(query, actions)
+
+    structured_query = _run_t5(query, t5_inference.generate_batch)
+
+    logger.debug("Generated structured query: %s", structured_query)
+    return _free_form_query(query, structured_query)
+
+
+def generate_many_with_t5(queries, actions=None):
+    """generate_with_t5 for several queries in one padded generate call, as JSON text in order"""
+    if T5_DECODING == "constrained":
+        choices = t5_inference.generate_constrained_batch([_constrained_request(query, actions) for query in queries])
+        return [json.dumps(_constrained_query(query, action, road_number))
+                for query, (action, road_number) in zip(queries, choices)]
+    return [_free_form_query(query, generated)
+            for query, generated in zip(queries, t5_inference.generate_batch(queries))]
+
+
+class ParseCache:
+    """Bounded LRU of parsed queries keyed by their template
+
+    Road numbers and timestamps are masked out of the query text, so
+    "max on road 7 between A and B" and "max on road 9 between C and D" share
+    one entry and the values are substituted back in on a hit. Set path to
+    load the cache from a JSON file and write it back at exit.
+    """
+
+    def __init__(self, maxsize=PARSE_CACHE_SIZE, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        if path:
+            if os.path.exists(path):
+                self.load(path)
+            atexit.register(self.save)
+
+    @staticmethod
+    def template(query, actions=None):
+        """Mask road numbers and timestamps, returning (template key, slot values)"""
+        slots = {}
+
+        def mask(prefix, value):
+            name = f"<{prefix}{sum(1 for key in slots if key.startswith('<' + prefix))}>"
+            slots[name] = value
+            return name
+
+        text = re.sub(TIMESTAMP_PATTERN, lambda m: mask('t', m.group(0)), query)
+        text = re.sub(ROAD_PATTERN, lambda m: 'road ' + mask('r', f"Road_{m.group(1)}"), text, flags=re.IGNORECASE)
+        key = ' '.join(text.lower().split())
+        if actions is not None:
+            key += ' |' + ','.join(sorted(actions))
+        return key, slots
+
+    def get(self, query, actions=None):
+        """Cached structured query for this query's template with its values filled in, or None"""
+        key, slots = self.template(query, actions)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return {field: slots.get(value, value) if isinstance(value, str) else value
+                for field, value in entry.items()}
+
+    def put(self, query, structured_query, actions=None):
+        """Remember a parse under its template, unless it holds values that didn't come from a slot"""
+        key, slots = self.template(query, actions)
+        names = {}
+        for name, value in slots.items():
+            # A value filling two slots can't say which one a field came from; such
+            # parses stay uncached rather than bind every field to the last slot
+            names[value] = None if value in names else name
+        if any(isinstance(value, str) and value in names and names[value] is None
+               for value in structured_query.values()):
+            return
+        entry = {field: names.get(value, value) if isinstance(value, str) else value
+                 for field, value in structured_query.items()}
+        for value in entry.values():
+            if isinstance(value, str) and (re.search(TIMESTAMP_PATTERN, value) or re.search(r'Road_\d', value)):
+                return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def load(self, path):
+        with open(path) as f:
+            for key, entry in json.load(f):
+                slot_fields = [value for value in entry.values() if isinstance(value, str) and value.startswith('<')]
+                # Files written before ambiguous parses were skipped may bind two fields to one slot
+                if len(slot_fields) == len(set(slot_fields)):
+                    self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def save(self, path=None):
+        path = path or self.path
+        if path:
+            with open(path, 'w') as f:
+                json.dump(list(self._entries.items()), f)
+
+
+# Point PARSE_CACHE_FILE at a JSON file to keep the warm cache across restarts
+parse_cache = ParseCache(path=os.environ.get("PARSE_CACHE_FILE"))
+
+
+UNPARSEABLE = {"error": "I couldn't understand your query. Please try rephrasing it."}
+
+
+def parse_query(query, actions=None):
+    """Structured query dict for a query, falling through to flan-t5 only when the rules can't parse it"""
+    cached = parse_cache.get(query, actions)
+    if cached is not None:
+        return cached
+
+    structured_query = parse_rule_based(query, actions)
+    if structured_query is None:
+        structured_query = _from_generated(generate_with_t5(query, actions))
+        if structured_query is None:
+            return dict(UNPARSEABLE)
+    parse_cache.put(query, structured_query, actions)
+    return structured_query
+
+
+def _from_generated(generated):
+    try:
+        structured_query = json.loads(generated)
+    except json.JSONDecodeError:
+        return None
+    return structured_query if isinstance(structured_query, dict) else None
+
+
+def parse_queries(queries, actions=None, batch_size=T5_BATCH_SIZE):
+    """parse_query for many queries, sending all the ones the rules can't parse to flan-t5 in batches"""
+    parsed = [None] * len(queries)
+    pending = []
+    for i, query in enumerate(queries):
+        structured_query = parse_cache.get(query, actions)
+        if structured_query is None:
+            structured_query = parse_rule_based(query, actions)
+            if structured_query is not None:
+                parse_cache.put(query, structured_query, actions)
+        if structured_query is None:
+            pending.append(i)
+        else:
+            parsed[i] = structured_query
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        for i, generated in zip(batch, generate_many_with_t5([queries[i] for i in batch], actions)):
+            structured_query = _from_generated(generated)
+            if structured_query is None:
+                parsed[i] = dict(UNPARSEABLE)
+            else:
+                parse_cache.put(queries[i], structured_query, actions)
+                parsed[i] = structured_query
+    return parsed
+
+
+def compile_query(query, actions=None):
+    """QueryPlan for a natural-language query, ready for water_engine.answer without a JSON round trip"""
+    try:
+        return QueryPlan.from_dict(parse_query(query, actions))
+    except (TypeError, ValueError) as e:
+        return QueryPlan(error=f"Error processing query: {str(e)}")
+
+
+def generate_structured_query(query, actions=None):
+    """Generate a structured query as JSON text, the external form of parse_query"""
+    return json.dumps(parse_query(query, actions))
@@ -0,0 +1,117 @@
+import json
+
+import pandas as pd
+
+# Structured queries compiled once into slotted plan objects. The JSON dict
+# form stays the external format (parser output, HTTP requests, the parse
+# cache file); inside the process a query travels as a QueryPlan whose
+# timestamps are parsed a single time and whose result-cache key is built on
+# first use. pd.to_datetime on a lone string costs hundreds of microseconds,
+# pd.Timestamp a couple, so compiling is also where timestamps get cheap.
+
+FIELDS = ('action', 'road_id', 'timestamp', 'start_timestamp', 'end_timestamp', 'match', 'tolerance',
+          'page_size', 'cursor', 'threshold', 'k', 'metric', 'window', 'error')
+TIMESTAMP_FIELDS = ('timestamp', 'start_timestamp', 'end_timestamp', 'cursor')
+
+
+def _instant(value):
+    """pd.Timestamp for a timestamp field, or None when it is absent or empty"""
+    if value is None or value == "":
+        return None
+    return pd.Timestamp(value)
+
+
+def _ns(value):
+    return value.as_unit('ns').value if value is not None else None
+
+
+class QueryPlan:
+    """One structured query with its fields as attributes, timestamps as pd.Timestamp or None
+
+    Fields a query leaves out are None, except action ("") and match
+    ("exact"); handlers apply the remaining defaults.
+    """
+
+    __slots__ = FIELDS + ('_key',)
+
+    def __init__(self, action="", road_id=None, timestamp=None, start_timestamp=None, end_timestamp=None,
+                 match="exact", tolerance=None, page_size=None, cursor=None, threshold=None, k=None,
+                 metric=None, window=None, error=None):
+        self.action = action
+        self.road_id = road_id
+        self.timestamp = timestamp
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = end_timestamp
+        self.match = match
+        self.tolerance = tolerance
+        self.page_size = page_size
+        self.cursor = cursor
+        self.threshold = threshold
+        self.k = k
+        self.metric = metric
+        self.window = window
+        self.error = error
+        self._key = None
+
+    @classmethod
+    def from_dict(cls, query_data):
+        """Compile a structured query dict; raises ValueError for a timestamp or number that doesn't parse"""
+        if not isinstance(query_data, dict):
+            raise ValueError("A structured query must be a JSON object")
+        if "error" in query_data:
+            return cls(error=str(query_data["error"]))
+        fields = {field: query_data[field] for field in FIELDS if query_data.get(field) is not None}
+        for field in TIMESTAMP_FIELDS:
+            if field in fields:
+                fields[field] = _instant(fields[field])
+        for field in ('page_size', 'k'):
+            if field in fields:
+                fields[field] = int(fields[field]) if fields[field] != "" else None
+        return cls(**fields)
+
+    @classmethod
+    def from_json(cls, structured_query):
+        return cls.from_dict(json.loads(structured_query))
+
+    def to_dict(self):
+        """External dict form, holding only the fields the query set"""
+        if self.error is not None:
+            return {"error": self.error}
+        query_data = {}
+        for field in FIELDS:
+            value = getattr(self, field)
+            if value is None or (field == 'match' and value == "exact"):
+                continue
+            query_data[field] = str(value) if field in TIMESTAMP_FIELDS else value
+        return query_data
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def replace(self, **changes):
+        """Copy of the plan with some fields changed"""
+        plan = QueryPlan(**{field: getattr(self, field) for field in FIELDS})
+        for field, value in changes.items():
+            setattr(plan, field, value)
+        return plan
+
+    @property
+    def key(self):
+        """Hashable normal form for the result cache; timestamps compare by instant, not spelling"""
+        if self._key is None:
+            self._key = (self.action, self.road_id, _ns(self.timestamp), _ns(self.start_timestamp),
+                         _ns(self.end_timestamp), self.match, self.tolerance, self.page_size, _ns(self.cursor),
+                         self.threshold, self.k, self.metric, self.window)
+        return self._key
+
+    def __repr__(self):
+        return f"QueryPlan({self.to_dict()})"
+
+
+def compile_plan(query):
+    """QueryPlan for a plan, a structured query dict or its JSON text"""
+    if isinstance(query, QueryPlan):
+        return query
+    if isinstance(query, str):
+        return QueryPlan.from_json(query)
+    return QueryPlan.from_dict(query)
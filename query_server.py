@@ -0,0 +1,77 @@
+import argparse
+import atexit
+import multiprocessing
+import os
+import sys
+
+import code5
+import t5_inference
+from result_cache import ResultCache
+from water_store import share_store
+
+# Multi-process query server: the parent loads the dataset (and optionally the
+# flan-t5 weights) once, then forks workers that share it copy-on-write.
+
+
+def _init_worker(threads):
+    # Keep each worker to its share of the cores instead of every worker using all of them
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+
+
+def answer(query):
+    """Run one natural-language query through the code5 pipeline"""
+    return code5.execute_query(code5.compile_query(query))
+
+
+class QueryPool:
+    """Fork-after-load pool of workers answering queries against one shared dataset"""
+
+    def __init__(self, workers=None, preload_model=False):
+        self.workers = workers or os.cpu_count()
+        # In-memory readings go to shared memory; memory-mapped stores already share pages
+        code5.store, self._shm = share_store(code5.store)
+        # The old cache would check versions of the store just replaced, and keep its arrays alive
+        code5.result_cache = ResultCache(code5.store)
+        if self._shm is not None:
+            atexit.register(self._release)
+        if preload_model:
+            t5_inference.load_t5()
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        context = multiprocessing.get_context("fork")
+        self._pool = context.Pool(self.workers, initializer=_init_worker, initargs=(threads,))
+
+    def map(self, queries, chunksize=1):
+        """Answer queries in parallel, yielding results in input order"""
+        return self._pool.imap(answer, queries, chunksize)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        self._release()
+
+    def _release(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer water level queries from stdin with a pool of worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--preload-model", action="store_true",
+                        help="load flan-t5 in the parent so workers share its weights")
+    args = parser.parse_args()
+
+    pool = QueryPool(args.workers, args.preload_model)
+    try:
+        queries = (line.strip() for line in sys.stdin if line.strip())
+        for result in pool.map(queries):
+            print(result, flush=True)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+
+from water_store import timestamp_ns
+
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+# Results that list or count rows change with any append in their time span,
+# not only with new readings on their own road. Flood answers are among them:
+# time above a threshold is a share of all rows, and gap rows end an ongoing event
+ROW_DEPENDENT_ACTIONS = {
+    "retrieve_all_water_levels",
+    "retrieve_all_water_levels_in_range",
+    "retrieve_average_water_level",
+    "retrieve_roads_above_threshold",
+    "retrieve_top_roads",
+    "count_flooded_roads_per_hour",
+    "retrieve_flood_events",
+    "retrieve_longest_flood",
+    "retrieve_time_above_threshold",
+}
+OPEN_ENDED = float('inf')
+
+
+def _result_size(result):
+    """Approximate memory held by a cached result, counting nested readings"""
+    if isinstance(result, str):
+        return sys.getsizeof(result)
+    return sys.getsizeof(result) + len(json.dumps(result))
+
+
+class _Entry:
+    __slots__ = ('result', 'version', 'road_id', 'time_end', 'row_dependent', 'size')
+
+    def __init__(self, result, version, road_id, time_end, row_dependent):
+        self.result = result
+        self.version = version
+        self.road_id = road_id
+        self.time_end = time_end
+        self.row_dependent = row_dependent
+        self.size = _result_size(result)
+
+
+class ResultCache:
+    """Bounded LRU of query results that survives appends which don't affect them
+
+    Entries are keyed by QueryPlan.key and stamped with the store version they
+    were computed at. When the store has moved on, only the appends since then
+    are checked: an entry is dropped if an append started at or before the end
+    of its time span and added readings on its road (or any rows at all, for
+    results that list or count rows).
+    """
+
+    def __init__(self, store, maxsize=RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_BYTES):
+        self.store = store
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        # Shared by Streamlit sessions and server threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(plan):
+        """Hashable normal form of a compiled query; timestamps compare by instant, not spelling"""
+        return plan.key
+
+    @staticmethod
+    def _time_end(plan):
+        """Latest instant the result depends on"""
+        if plan.end_timestamp is not None:
+            return timestamp_ns(plan.end_timestamp)
+        if plan.timestamp is not None and plan.match == "exact":
+            return timestamp_ns(plan.timestamp)
+        # Whole-history, latest and as-of answers can all move with new rows
+        return OPEN_ENDED
+
+    def _stale(self, entry):
+        if entry.version == self.store.version:
+            return False
+        # Appends arrive from the CSV follower thread; walk a copy taken with the version it reaches
+        with self.store.lock:
+            log = list(self.store.append_log)
+            version = self.store.version
+        if not log or log[0][0] > entry.version + 1:
+            # The log no longer reaches back to this entry
+            return True
+        for version, first_timestamp, roads in log:
+            if version <= entry.version:
+                continue
+            if first_timestamp <= entry.time_end and (entry.row_dependent or entry.road_id in roads):
+                return True
+        # Still valid; don't check these appends again next time
+        entry.version = version
+        return False
+
+    def get(self, key):
+        """Cached result for a normalized query, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._stale(entry):
+                self._remove(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.result
+
+    def put(self, key, plan, result, version):
+        """Store a result computed against the given store version"""
+        entry = _Entry(result, version, plan.road_id, self._time_end(plan), plan.action in ROW_DEPENDENT_ACTIONS)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.bytes += entry.size
+            while len(self._entries) > self.maxsize or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key).size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+            }
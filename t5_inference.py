@@ -0,0 +1,242 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+
+# flan-t5 inference for queries the rule-based parser can't handle. Nothing
+# heavy is imported until the first query actually needs the model.
+model_name = "google/flan-t5-small"
+MAX_NEW_TOKENS = 100
+
+# Inference backend, picked at startup with T5_BACKEND:
+#   fp32  plain PyTorch, as the model ships
+#   int8  PyTorch with Linear layers dynamically quantized to int8
+#   onnx  exported, graph-optimized ONNX Runtime model (needs optimum[onnxruntime])
+BACKENDS = ("fp32", "int8", "onnx")
+T5_BACKEND = os.environ.get("T5_BACKEND", "fp32")
+# Optional cap on intra-op threads, e.g. one per worker process
+T5_THREADS = os.environ.get("T5_THREADS")
+
+T5_PROMPT = (
+    "You are an assistant that converts questions about water levels into a structured JSON format."
+    " The output must be a complete JSON object enclosed in curly braces {{}}."
+    " The JSON object should include the following keys: 'action', 'road_id', and 'timestamp' (optional)."
+    " The road_id should always start with 'Road_' followed by the exact road number from the query."
+    " Handle potential spelling mistakes in the query."
+    "\nHere are some examples of questions and their expected outputs:\n"
+    "- Question: What is the higest water level on road 101?\n"
+    "  Output: {{\"action\": \"retrieve_max_water_level\", \"road_id\": \"Road_101\"}}\n"
+    "- Question: What was the water levl on road 102 at 2024-10-15 08:00:00?\n"
+    "  Output: {{\"action\": \"retrieve_water_level\", \"road_id\": \"Road_102\", \"timestamp\": \"2024-10-15 08:00:00\"}}\n"
+    "- Question: What are all the water levels on road 103?\n"
+    "  Output: {{\"action\": \"retrieve_all_water_levels\", \"road_id\": \"Road_103\"}}\n"
+    "\nQuestion: {query}\n"
+    "Output (just JSON): "
+)
+
+
+# Constrained decoding prompts: the model only picks the action (and a road
+# number when the query text has none); the JSON itself is assembled by the caller
+ACTION_PROMPT = (
+    "Question about water levels on a road: {query}\n"
+    "Which action answers the question?\nOPTIONS:\n{options}"
+)
+ROAD_PROMPT = "Question about water levels on a road: {query}\nWhich road number is the question about?"
+MAX_ROAD_DIGITS = 6
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer():
+    """Import and load the flan-t5 tokenizer, shared by every backend"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+@lru_cache(maxsize=None)
+def load_t5(backend=None):
+    """Import and load the flan-t5 tokenizer and model for a backend on first use"""
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
+    backend = backend or T5_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown T5 backend: {backend}. Choose one of {', '.join(BACKENDS)}")
+    if T5_THREADS:
+        torch.set_num_threads(int(T5_THREADS))
+
+    tokenizer = load_tokenizer()
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+    else:
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name).eval()
+        if backend == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return tokenizer, model
+
+
+def generate_batch(queries, backend=None):
+    """Run one padded generate call over several queries and return the decoded outputs in order"""
+    import torch
+    tokenizer, model = load_t5(backend)
+    prompts = [T5_PROMPT.format(query=query) for query in queries]
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+
+    with torch.no_grad():
+        outputs = model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS)
+
+    return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+
+@lru_cache(maxsize=None)
+def _action_trie(actions):
+    """Token trie over the action names, each ending in EOS, plus a map from token path back to action"""
+    tokenizer = load_tokenizer()
+    trie, paths = {}, {}
+    for action in actions:
+        ids = tuple(tokenizer(action, add_special_tokens=False).input_ids) + (tokenizer.eos_token_id,)
+        paths[ids] = action
+        node = trie
+        for token in ids:
+            node = node.setdefault(token, {})
+    return trie, paths
+
+
+@lru_cache(maxsize=None)
+def _digit_tokens():
+    tokenizer = load_tokenizer()
+    return sorted(i for token, i in tokenizer.get_vocab().items() if token.lstrip('\u2581').isdigit())
+
+
+def _generated_tokens(row, pad):
+    """Tokens produced after the decoder start token, without trailing padding"""
+    tokens = row.tolist()[1:]
+    while tokens and tokens[-1] == pad:
+        tokens.pop()
+    return tuple(tokens)
+
+
+def _constrained_generate(prompts, allowed, max_new_tokens, backend=None):
+    import torch
+    tokenizer, model = load_t5(backend)
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+    with torch.no_grad():
+        return model.generate(**inputs, prefix_allowed_tokens_fn=allowed, max_new_tokens=max_new_tokens,
+                              num_beams=1, do_sample=False)
+
+
+def generate_constrained_batch(requests, backend=None):
+    """Schema-constrained decoding for (query, actions, needs_road) requests
+
+    The action is decoded through a token trie of the allowed action names and
+    generation stops at the EOS that closes the name, so the output can only be
+    one of them. Requests flagged needs_road also decode a road number limited
+    to digit tokens. Returns (action, road number or None) per request.
+    """
+    tokenizer = load_tokenizer()
+    eos, pad = tokenizer.eos_token_id, tokenizer.pad_token_id
+    tries = [_action_trie(tuple(actions)) for _, actions, _ in requests]
+
+    def allowed_action(batch_id, input_ids):
+        node = tries[batch_id][0]
+        for token in input_ids.tolist()[1:]:
+            node = node.get(token)
+            if node is None:
+                return [pad]
+        return list(node) or [pad]
+
+    prompts = [ACTION_PROMPT.format(query=query, options="\n".join(f"- {action}" for action in actions))
+               for query, actions, _ in requests]
+    depth = max(len(ids) for _, paths in tries for ids in paths)
+    outputs = _constrained_generate(prompts, allowed_action, depth, backend)
+    actions = [paths.get(_generated_tokens(row, pad)) for (_, paths), row in zip(tries, outputs)]
+
+    roads = [None] * len(requests)
+    pending = [i for i, (_, _, needs_road) in enumerate(requests) if needs_road]
+    if pending:
+        digits = _digit_tokens()
+
+        def allowed_digits(batch_id, input_ids):
+            generated = input_ids.tolist()[1:]
+            if generated and generated[-1] in (eos, pad):
+                return [pad]
+            return digits if not generated else digits + [eos]
+
+        outputs = _constrained_generate([ROAD_PROMPT.format(query=requests[i][0]) for i in pending],
+                                        allowed_digits, MAX_ROAD_DIGITS, backend)
+        for i, row in zip(pending, outputs):
+            number = tokenizer.decode(row, skip_special_tokens=True).replace(' ', '')
+            roads[i] = number if number.isdigit() else None
+
+    return list(zip(actions, roads))
+
+
+class BatchingWorker:
+    """Collects concurrent queries into micro-batches for a single generate call
+
+    A batch closes when max_batch_size queries have arrived or max_wait_ms has
+    passed since the first one, whichever comes first. A larger wait trades
+    per-query latency for throughput under load.
+    """
+
+    def __init__(self, generate=generate_batch, max_batch_size=16, max_wait_ms=10):
+        self.generate = generate
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.queries = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="t5-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query):
+        """Queue a query (or constrained request) and return a Future for its decoded output"""
+        future = Future()
+        self._queue.put((query, future))
+        return future
+
+    def __call__(self, query):
+        return self.submit(query).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then let the loop see the shutdown
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            queries = [query for query, _ in batch]
+            try:
+                outputs = self.generate(queries)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(batch)
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
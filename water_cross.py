@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+
+from water_store import MISSING_CODE, threshold_codes
+
+# Cross-road questions ("which roads are above 4 m", "top 10 roads this week")
+# answered with whole-matrix numpy operations over a timestamps x roads block.
+# Windows are processed CROSS_ROAD_CHUNK_ROWS rows at a time, so memory stays
+# bounded however long the window is; whole-history questions come straight
+# from the per-road summaries without touching the readings. Quantized stores
+# are scanned as int16 codes, four times as many roads per cache line, and
+# only the final per-road results are converted to meters.
+
+FLOOD_THRESHOLD = 4.0
+# Named alert levels queries may use instead of a height, in meters
+ALERT_LEVELS = {'watch': 3.0, 'warning': 4.0, 'severe': 4.5}
+TOP_ROADS = 10
+CROSS_ROAD_CHUNK_ROWS = 4096
+HOUR_NS = 3600 * 10**9
+# Span counted by flooded_per_hour when the query gives no range
+FLOODED_PER_HOUR_SPAN = '24h'
+METRICS = ('max', 'mean')
+
+
+def resolve_threshold(value=None):
+    """Threshold in meters for a number, a named alert level or None (the flood threshold)"""
+    if value is None:
+        return FLOOD_THRESHOLD
+    if isinstance(value, str) and value.lower() in ALERT_LEVELS:
+        return ALERT_LEVELS[value.lower()]
+    return float(value)
+
+
+def window_stats(store, lo, hi, chunk_rows=CROSS_ROAD_CHUNK_ROWS):
+    """Per-road max, position of the max, sum, mean and reading count over rows [lo, hi)"""
+    if store.quantized:
+        return _window_code_stats(store, lo, hi, chunk_rows)
+    roads = len(store.road_ids)
+    best = np.full(roads, -np.inf)
+    best_pos = np.full(roads, -1, dtype=np.int64)
+    total = np.zeros(roads)
+    count = np.zeros(roads, dtype=np.int64)
+    for start in range(lo, hi, chunk_rows):
+        block = store.row_block(start, min(start + chunk_rows, hi))
+        present = ~np.isnan(block)
+        keys = np.where(present, block, -np.inf)
+        rows = np.argmax(keys, axis=0)
+        block_best = keys[rows, np.arange(roads)]
+        # Strictly greater keeps the first occurrence, as the single-road actions do
+        better = block_best > best
+        best[better] = block_best[better]
+        best_pos[better] = rows[better] + start
+        total += np.where(present, block, 0.0).sum(axis=0)
+        count += present.sum(axis=0)
+    return {
+        'max': np.where(count > 0, best, np.nan),
+        'max_pos': np.where(count > 0, best_pos, -1),
+        'sum': total,
+        'mean': np.where(count > 0, total / np.maximum(count, 1), np.nan),
+        'count': count,
+    }
+
+
+def _window_code_stats(store, lo, hi, chunk_rows):
+    roads = len(store.road_ids)
+    best = np.full(roads, MISSING_CODE, dtype=np.int16)
+    best_pos = np.full(roads, -1, dtype=np.int64)
+    total = np.zeros(roads, dtype=np.int64)
+    count = np.zeros(roads, dtype=np.int64)
+    for start in range(lo, hi, chunk_rows):
+        block = store.code_block(start, min(start + chunk_rows, hi))
+        present = block != MISSING_CODE
+        # MISSING_CODE is the smallest int16, so gaps never win the max
+        rows = np.argmax(block, axis=0)
+        block_best = block[rows, np.arange(roads)]
+        better = block_best > best
+        best[better] = block_best[better]
+        best_pos[better] = rows[better] + start
+        # Integer sums are exact, unlike adding up floats
+        total += np.where(present, block, 0).sum(axis=0, dtype=np.int64)
+        count += present.sum(axis=0)
+    scale = 10.0 ** store.road_decimals()
+    return {
+        'max': np.where(count > 0, best / scale, np.nan),
+        'max_pos': np.where(count > 0, best_pos, -1),
+        'sum': total / scale,
+        'mean': np.where(count > 0, total / scale / np.maximum(count, 1), np.nan),
+        'count': count,
+    }
+
+
+def history_stats(store):
+    """window_stats over every row, taken from the per-road summaries"""
+    summaries = store.summaries()
+    count = summaries.count
+    return {
+        'max': summaries.max,
+        'max_pos': summaries.max_pos,
+        'sum': summaries.sum,
+        'mean': np.where(count > 0, summaries.sum / np.maximum(count, 1), np.nan),
+        'count': count,
+    }
+
+
+def _stats(store, start=None, end=None):
+    if start is None and end is None:
+        return history_stats(store)
+    lo, hi = store.slice_range(start if start is not None else store.first_timestamp(),
+                               end if end is not None else store.last_timestamp())
+    return window_stats(store, lo, hi)
+
+
+def roads_at(store, position):
+    """Every road's reading at one row, as an array in road_ids order"""
+    return store.row_block(position, position + 1)[0]
+
+
+def roads_above(store, threshold=FLOOD_THRESHOLD, position=None, start=None, end=None):
+    """Roads at or above threshold, highest first, as (road, level, row of that level) tuples
+
+    With position, compares the readings at that row; with a start/end window,
+    each road's highest reading in it; with neither, the latest row.
+    """
+    if start is not None or end is not None:
+        stats = _stats(store, start, end)
+        levels, positions = stats['max'], stats['max_pos']
+    else:
+        position = len(store) - 1 if position is None else position
+        levels = roads_at(store, position)
+        positions = np.full(len(levels), position)
+    # NaN compares False, so missing readings never count as flooded
+    hits = np.flatnonzero(levels >= threshold)
+    hits = hits[np.argsort(-levels[hits], kind='stable')]
+    return [(store.road_ids[i], float(levels[i]), int(positions[i])) for i in hits]
+
+
+def top_roads(store, k=TOP_ROADS, metric='max', start=None, end=None):
+    """The k roads with the highest max or mean level, as (road, value, row of the max or None) tuples"""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}. Choose one of {', '.join(METRICS)}")
+    stats = _stats(store, start, end)
+    values = stats[metric]
+    keys = np.where(np.isnan(values), -np.inf, values)
+    k = min(k, int(np.count_nonzero(~np.isnan(values))))
+    if k <= 0:
+        return []
+    # Stable, so ties keep road order like the single-road actions' first occurrences
+    top = np.argsort(-keys, kind='stable')[:k]
+    return [(store.road_ids[i], float(values[i]),
+             int(stats['max_pos'][i]) if metric == 'max' else None) for i in top]
+
+
+def flooded_per_hour(store, threshold=FLOOD_THRESHOLD, start=None, end=None, chunk_rows=CROSS_ROAD_CHUNK_ROWS):
+    """(hour, number of roads with any reading at or above threshold in that hour) for a time range
+
+    Without a range, covers the last FLOODED_PER_HOUR_SPAN of data. Rows are
+    read chunk_rows hours at a time, so an hour never straddles two blocks.
+    """
+    if end is None:
+        end = store.last_timestamp()
+    if start is None:
+        start = pd.Timestamp(end) - pd.Timedelta(FLOODED_PER_HOUR_SPAN)
+    lo, hi = store.slice_range(start, end)
+    if lo == hi:
+        return []
+
+    hours = np.asarray(store.timestamps[lo:hi]) // HOUR_NS
+    # Row offsets where each hour starts
+    starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+    # Quantized stores compare codes against the threshold's code for each road
+    codes = threshold_codes(threshold, store.road_decimals()) if store.quantized else None
+    counts = []
+    for first in range(0, len(starts), max(1, chunk_rows)):
+        bucket_starts = starts[first:first + chunk_rows]
+        block_lo = lo + int(bucket_starts[0])
+        block_hi = lo + (int(starts[first + chunk_rows]) if first + chunk_rows < len(starts) else hi - lo)
+        if codes is not None:
+            flooded = store.code_block(block_lo, block_hi) >= codes
+        else:
+            flooded = store.row_block(block_lo, block_hi) >= threshold
+        per_hour = np.logical_or.reduceat(flooded, bucket_starts - bucket_starts[0], axis=0)
+        counts.append(per_hour.sum(axis=1))
+    counts = np.concatenate(counts)
+    hour_index = pd.DatetimeIndex((hours[starts] * HOUR_NS).view('datetime64[ns]'))
+    return list(zip(hour_index, counts.tolist()))
@@ -0,0 +1,561 @@
+import csv
+import io
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+from query_parser import CROSS_ROAD_ACTIONS, FLOOD_EVENT_ACTIONS, RANGE_ACTIONS
+from query_plan import QueryPlan, compile_plan
+from result_cache import ResultCache
+from water_cross import HOUR_NS, TOP_ROADS, flooded_per_hour, resolve_threshold, roads_above, top_roads
+from water_store import ASOF_TOLERANCE, timestamp_ns
+
+# Query execution shared by the CLI, the Streamlit app and the HTTP API.
+# answer() takes a compiled QueryPlan (see query_plan), dispatches it through
+# HANDLERS and returns plain JSON-serializable dicts; format_answer() turns
+# them into the sentences the interactive front ends print.
+
+# Actions that list readings answer one page at a time, resumed from a cursor
+LISTING_ACTIONS = {"retrieve_all_water_levels", "retrieve_all_water_levels_in_range"}
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 100_000
+# Streamed output is formatted this many rows at a time, so memory stays flat for any range
+STREAM_CHUNK_ROWS = 8192
+STREAM_FORMATS = ("text", "csv", "ndjson")
+
+
+def _level(value):
+    """Water level as a float, or None for a missing reading"""
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _time(value):
+    return str(pd.Timestamp(value)) if value is not None else None
+
+
+def _reading_chunks(store, road_id, lo, hi, chunk_rows=STREAM_CHUNK_ROWS):
+    """(timestamp strings, levels with None for gaps) for rows [lo, hi), a block at a time"""
+    levels = store.column(road_id)
+    for start in range(lo, hi, chunk_rows):
+        end = min(start + chunk_rows, hi)
+        block = np.asarray(levels[start:end], dtype=object)
+        block[pd.isnull(block)] = None
+        yield store.timestamp_index(start, end).astype(str).tolist(), block.tolist()
+
+
+def iter_readings(store, road_id, lo=0, hi=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """Lazily yield (timestamp, level) for one road's rows [lo, hi)"""
+    hi = len(store) if hi is None else hi
+    for timestamps, levels in _reading_chunks(store, road_id, lo, hi, chunk_rows):
+        yield from zip(timestamps, levels)
+
+
+def _listing_span(store, plan):
+    """Row slice a listing action covers, before any cursor is applied"""
+    if plan.action == "retrieve_all_water_levels_in_range":
+        return store.slice_range(*_range_span(store, plan))
+    return 0, len(store)
+
+
+def _page(store, plan, lo, hi):
+    """Rows [lo, hi) narrowed to the requested page, plus the cursor that resumes after it"""
+    if plan.cursor is not None:
+        # Cursors are timestamps, so they stay valid when rows are appended
+        lo = max(lo, store.slice_range(plan.cursor, plan.cursor)[0])
+    page_size = min(max(plan.page_size or PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    end = min(lo + page_size, hi)
+    next_cursor = _time(store.timestamp_at(end)) if end < hi else None
+    return lo, end, next_cursor
+
+
+def answer(store, query, cache=None):
+    """Answer a query against the store, reusing a cached answer when one is still valid
+
+    query is a QueryPlan, or a structured query dict (or its JSON text) that
+    is compiled into one first.
+    """
+    plan = compile_plan(query)
+    if plan.error is not None:
+        return {"error": plan.error}
+
+    if plan.action not in CROSS_ROAD_ACTIONS and (not plan.road_id or not store.has_road(plan.road_id)):
+        return {"error": "Invalid or missing road ID", "available_roads": store.road_ids}
+
+    if cache is None:
+        return _answer(store, plan)
+    key = ResultCache.key(plan)
+    result = cache.get(key)
+    if result is None:
+        version = store.version
+        result = _answer(store, plan)
+        cache.put(key, plan, result, version)
+    return result
+
+
+def answer_many(store, queries, cache=None):
+    """Answer a batch of queries, yielding (index, result) grouped by road and action
+
+    Grouping keeps each road's column and indexes hot across its queries, and
+    the exact point lookups on a road share one timestamp search and one read
+    of the column. index is the query's position in queries.
+    """
+    plans = [_compile_or_error(query) for query in queries]
+    order = sorted(range(len(plans)), key=lambda i: (str(plans[i].road_id or ""), str(plans[i].action)))
+    try:
+        points = _answer_points(store, plans, order, cache)
+    except Exception:
+        # Answered one at a time below, where the query at fault gets its own error
+        points = {}
+    for i in order:
+        if i in points:
+            yield i, points[i]
+            continue
+        try:
+            result = answer(store, plans[i], cache)
+        except Exception as e:
+            # One bad query in a batch gets an error answer instead of ending the batch
+            result = {"error": f"Error processing query: {str(e)}"}
+        yield i, result
+
+
+def _compile_or_error(query):
+    try:
+        return compile_plan(query)
+    except (TypeError, ValueError) as e:
+        return QueryPlan(error=f"Error processing query: {str(e)}")
+
+
+def _batched_point(store, plan):
+    return (plan.error is None and plan.action == "retrieve_water_level" and plan.timestamp is not None
+            and plan.match == "exact" and bool(plan.road_id) and store.has_road(plan.road_id))
+
+
+def _answer_points(store, plans, order, cache):
+    """Results for the exact point lookups among plans, located and read a road at a time"""
+    results = {}
+    pending = {}
+    for i in order:
+        plan = plans[i]
+        if not _batched_point(store, plan):
+            continue
+        result = cache.get(ResultCache.key(plan)) if cache is not None else None
+        if result is not None:
+            results[i] = result
+        else:
+            pending.setdefault(plan.road_id, []).append(i)
+
+    version = store.version
+    for road_id, group in pending.items():
+        positions = store.locate_many([plans[i].timestamp for i in group])
+        found = positions >= 0
+        levels = np.full(len(group), np.nan)
+        levels[found] = np.asarray(store.column(road_id)[positions[found]], dtype=float)
+        for i, position, level in zip(group, positions, levels):
+            plan = plans[i]
+            result = {"action": plan.action, "road_id": road_id, "requested_timestamp": _time(plan.timestamp)}
+            if position < 0:
+                result["no_data"] = True
+            else:
+                result.update(level=_level(level), timestamp=_time(store.timestamp_at(position)))
+            results[i] = result
+            if cache is not None:
+                cache.put(ResultCache.key(plan), plan, result, version)
+    return results
+
+
+def _span(store, plan):
+    """Explicit start/end timestamps, or a relative window ending at the latest reading, or (None, None)"""
+    if plan.start_timestamp is not None or plan.end_timestamp is not None:
+        return (plan.start_timestamp if plan.start_timestamp is not None else store.first_timestamp(),
+                plan.end_timestamp if plan.end_timestamp is not None else store.last_timestamp())
+    if plan.window:
+        end = store.last_timestamp()
+        return end - pd.Timedelta(plan.window), end
+    return None, None
+
+
+def _range_span(store, plan):
+    """Start and end of a per-road range; a missing bound runs to the first or latest reading"""
+    start, end = _span(store, plan)
+    if start is None:
+        return store.first_timestamp(), store.last_timestamp()
+    return start, end
+
+
+def _cross_road_result(store, plan):
+    result = {"action": plan.action}
+    start, end = _span(store, plan)
+    if start is not None:
+        result.update(start_timestamp=_time(start), end_timestamp=_time(end))
+    return result, start, end
+
+
+def _answer_roads_above(store, plan):
+    result, start, end = _cross_road_result(store, plan)
+    threshold = resolve_threshold(plan.threshold)
+    result["threshold"] = threshold
+    position = None
+    if start is None:
+        if plan.timestamp is not None:
+            result["requested_timestamp"] = _time(plan.timestamp)
+            position = store.locate(plan.timestamp, match=plan.match,
+                                    tolerance=plan.tolerance or ASOF_TOLERANCE)
+        elif len(store):
+            position = len(store) - 1
+        if position is None:
+            result["no_data"] = True
+            return result
+        result["timestamp"] = _time(store.timestamp_at(position))
+    roads = roads_above(store, threshold, position, start, end)
+    result["roads"] = [{"road_id": road, "level": level, "timestamp": _time(store.timestamp_at(row))}
+                       for road, level, row in roads]
+    return result
+
+
+def _answer_top_roads(store, plan):
+    result, start, end = _cross_road_result(store, plan)
+    metric = plan.metric or "max"
+    result.update(metric=metric, k=plan.k if plan.k is not None else TOP_ROADS)
+    roads = top_roads(store, result["k"], metric, start, end)
+    result["roads"] = [{"road_id": road, "level": value,
+                        "timestamp": _time(store.timestamp_at(row)) if row is not None and row >= 0 else None}
+                       for road, value, row in roads]
+    return result
+
+
+def _answer_flooded_per_hour(store, plan):
+    result, start, end = _cross_road_result(store, plan)
+    threshold = resolve_threshold(plan.threshold)
+    result["threshold"] = threshold
+    hours = flooded_per_hour(store, threshold, start, end)
+    if hours and start is None:
+        result.update(start_timestamp=_time(hours[0][0]), end_timestamp=_time(store.last_timestamp()))
+    result["hours"] = [[_time(hour), count] for hour, count in hours]
+    return result
+
+
+def _event(store, index, i):
+    event = index.event(i)
+    return {
+        "start": _time(event['start_ns']),
+        "end": _time(event['end_ns']),
+        "hours": event['duration_ns'] / HOUR_NS,
+        "peak": event['peak'],
+        "peak_timestamp": _time(store.timestamp_at(event['peak_pos'])),
+        "ongoing": event['ongoing'],
+    }
+
+
+def _answer_flood(store, plan):
+    action, road_id = plan.action, plan.road_id
+    result = {"action": action, "road_id": road_id}
+    threshold = resolve_threshold(plan.threshold)
+    index = store.event_index(road_id, threshold)
+    result["threshold"] = threshold
+    start, end = _span(store, plan)
+    start_ns = end_ns = None
+    if start is not None:
+        result.update(start_timestamp=_time(start), end_timestamp=_time(end))
+        start_ns, end_ns = timestamp_ns(start), timestamp_ns(end)
+
+    if action == "retrieve_flood_events":
+        i, j = index.overlapping(start_ns, end_ns)
+        result["events"] = [_event(store, index, k) for k in range(i, j)]
+    elif action == "retrieve_longest_flood":
+        longest = index.longest(start_ns, end_ns)
+        result["event"] = _event(store, index, longest) if longest is not None else None
+    else:
+        above = index.time_above(start_ns, end_ns)
+        span = ((end_ns if end_ns is not None else int(store.timestamps[-1])) -
+                (start_ns if start_ns is not None else int(store.timestamps[0]))) if len(store) else 0
+        result.update(hours=above / HOUR_NS, share=above / span if span > 0 else None)
+    return result
+
+
+# Whole-history actions are answered from the precomputed per-road summary
+def _answer_extremum(store, plan):
+    kind = 'max' if plan.action == "retrieve_max_water_level" else 'min'
+    summary = store.road_summary(plan.road_id)
+    return {"action": plan.action, "road_id": plan.road_id,
+            "level": _level(summary[kind]), "timestamp": _time(summary[f'{kind}_timestamp'])}
+
+
+def _answer_average(store, plan):
+    summary = store.road_summary(plan.road_id)
+    return {"action": plan.action, "road_id": plan.road_id, "level": _level(summary['mean']),
+            "count": summary['count'], "start_timestamp": _time(store.first_timestamp()),
+            "end_timestamp": _time(store.last_timestamp())}
+
+
+def _answer_latest(store, plan):
+    summary = store.road_summary(plan.road_id)
+    return {"action": "retrieve_latest_water_level", "road_id": plan.road_id,
+            "level": _level(summary['latest']), "timestamp": _time(summary['latest_timestamp'])}
+
+
+def _answer_point(store, plan):
+    # A point lookup without a timestamp returns the latest reading
+    if plan.timestamp is None:
+        return _answer_latest(store, plan)
+    result = {"action": plan.action, "road_id": plan.road_id, "requested_timestamp": _time(plan.timestamp)}
+    position = store.locate(plan.timestamp, match=plan.match, tolerance=plan.tolerance or ASOF_TOLERANCE)
+    if position is None:
+        result["no_data"] = True
+        return result
+    result.update(level=_level(store.column(plan.road_id)[position]), timestamp=_time(store.timestamp_at(position)))
+    return result
+
+
+def _answer_listing(store, plan):
+    lo, hi = _listing_span(store, plan)
+    rows = hi - lo
+    lo, end, next_cursor = _page(store, plan, lo, hi)
+    return {"action": plan.action, "road_id": plan.road_id, "rows": rows,
+            "readings": [list(row) for row in iter_readings(store, plan.road_id, lo, end)],
+            "next_cursor": next_cursor}
+
+
+def _answer_range(store, plan):
+    action, road_id = plan.action, plan.road_id
+    start, end = _range_span(store, plan)
+    result = {"action": action, "road_id": road_id, "start_timestamp": _time(start), "end_timestamp": _time(end)}
+    stats = store.range_summary(road_id, start, end)
+    if not stats['rows'] or (action != "retrieve_all_water_levels_in_range" and not stats['count']):
+        result["no_data"] = True
+        return result
+
+    if action == "retrieve_all_water_levels_in_range":
+        lo, hi = _listing_span(store, plan)
+        lo, end, next_cursor = _page(store, plan, lo, hi)
+        result.update(rows=stats['rows'], readings=[list(row) for row in iter_readings(store, road_id, lo, end)],
+                      next_cursor=next_cursor)
+        result["summary"] = {"min": _level(stats['min']), "max": _level(stats['max']),
+                             "mean": _level(stats['mean']), "count": stats['count']}
+    elif action == "retrieve_average_water_level_in_range":
+        result.update(level=_level(stats['mean']), std=_level(stats['variance'] ** 0.5), count=stats['count'])
+    else:
+        kind = 'max' if action == "retrieve_max_water_level_in_range" else 'min'
+        result.update(level=_level(stats[kind]), timestamp=_time(stats[f'{kind}_timestamp']))
+    return result
+
+
+# Action -> handler(store, plan); every handler returns the JSON-serializable answer
+HANDLERS = {
+    "retrieve_max_water_level": _answer_extremum,
+    "retrieve_min_water_level": _answer_extremum,
+    "retrieve_average_water_level": _answer_average,
+    "retrieve_latest_water_level": _answer_latest,
+    "retrieve_water_level": _answer_point,
+    "retrieve_all_water_levels": _answer_listing,
+    **{action: _answer_range for action in RANGE_ACTIONS},
+    **{action: _answer_flood for action in FLOOD_EVENT_ACTIONS},
+    "retrieve_roads_above_threshold": _answer_roads_above,
+    "retrieve_top_roads": _answer_top_roads,
+    "count_flooded_roads_per_hour": _answer_flooded_per_hour,
+}
+
+
+def _answer(store, plan):
+    handler = HANDLERS.get(plan.action)
+    if handler is None:
+        return {"error": "I couldn't understand your query. Please try rephrasing it."}
+    return handler(store, plan)
+
+
+def format_water_level(value):
+    """Format water level values consistently"""
+    return f"{float(value):.2f}" if value is not None else "N/A"
+
+
+def _text_lines(road_id, rows):
+    width = max(len(road_id), 6)
+    return "".join(f"{timestamp:>19}  {'NaN' if level is None else level:>{width}}\n" for timestamp, level in rows)
+
+
+def _text_header(road_id):
+    return f"{'Timestamp':>19}  {road_id:>{max(len(road_id), 6)}}\n"
+
+
+def _readings_table(result):
+    table = _text_header(result["road_id"]) + _text_lines(result["road_id"], result["readings"])
+    if result.get("next_cursor"):
+        table += (f"... {len(result['readings'])} of {result['rows']} readings shown; "
+                  f"continue from cursor {result['next_cursor']}\n")
+    return table.rstrip("\n")
+
+
+def _range_summary_text(result):
+    summary = result["summary"]
+    return (f"\n\nSummary for {result['road_id']} from {result['start_timestamp']} to {result['end_timestamp']}:"
+            f"\nMinimum: {format_water_level(summary['min'])} meters"
+            f"\nMaximum: {format_water_level(summary['max'])} meters"
+            f"\nAverage: {format_water_level(summary['mean'])} meters"
+            f"\nTotal readings: {summary['count']}")
+
+
+def _format_cross_road(result):
+    action = result["action"]
+    span = (f" between {result['start_timestamp']} and {result['end_timestamp']}"
+            if result.get("start_timestamp") else "")
+    if result.get("no_data"):
+        return f"No data available at {result['requested_timestamp']}."
+
+    if action == "retrieve_roads_above_threshold":
+        when = span or f" at {result['timestamp']}"
+        roads = result["roads"]
+        if not roads:
+            return f"No roads were at or above {format_water_level(result['threshold'])} meters{when}."
+        listed = ", ".join(f"{road['road_id']} ({format_water_level(road['level'])} m)" for road in roads)
+        return (f"{len(roads)} road{'s' if len(roads) != 1 else ''} at or above "
+                f"{format_water_level(result['threshold'])} meters{when}: {listed}.")
+
+    elif action == "retrieve_top_roads":
+        label = "maximum" if result["metric"] == "max" else "average"
+        lines = [f"Top {len(result['roads'])} roads by {label} water level{span or ' over the whole record'}:"]
+        for rank, road in enumerate(result["roads"], 1):
+            when = f" on {road['timestamp']}" if road["timestamp"] else ""
+            lines.append(f"{rank}. {road['road_id']}: {format_water_level(road['level'])} meters{when}")
+        return "\n".join(lines)
+
+    lines = [f"Roads at or above {format_water_level(result['threshold'])} meters per hour{span}:"]
+    lines += [f"{hour}  {count} road{'s' if count != 1 else ''}" for hour, count in result["hours"]]
+    return "\n".join(lines) if result["hours"] else f"No data available{span}."
+
+
+def _format_flood(result):
+    action, road_id = result["action"], result["road_id"]
+    level = f"{format_water_level(result['threshold'])} meters"
+    span = (f" between {result['start_timestamp']} and {result['end_timestamp']}"
+            if result.get("start_timestamp") else "")
+
+    def describe(event):
+        return (f"from {event['start']} to {event['end']}{' (ongoing)' if event['ongoing'] else ''}, "
+                f"{event['hours']:.1f} hours, peaking at {format_water_level(event['peak'])} meters "
+                f"on {event['peak_timestamp']}")
+
+    if action == "retrieve_flood_events":
+        events = result["events"]
+        if not events:
+            return f"{road_id} was never at or above {level}{span}."
+        lines = [f"{road_id} was at or above {level} {len(events)} time{'s' if len(events) != 1 else ''}{span}:"]
+        lines += [f"- {describe(event)}" for event in events]
+        return "\n".join(lines)
+    elif action == "retrieve_longest_flood":
+        if result["event"] is None:
+            return f"{road_id} was never at or above {level}{span}."
+        return f"The longest flood on {road_id} at or above {level}{span} lasted {describe(result['event'])}."
+    share = f" ({result['share']:.1%} of the time)" if result["share"] is not None else ""
+    return (f"{road_id} was at or above {level} for {result['hours']:.1f} hours"
+            f"{span or ' over the whole record'}{share}.")
+
+
+def format_answer(result):
+    """Render an answer() result as the sentence the interactive front ends show"""
+    if "error" in result:
+        if "available_roads" in result:
+            return (f"Error: {result['error']}. Available roads are: "
+                    f"{', '.join(result['available_roads'])}")
+        return result["error"]
+    if result.get("action") in CROSS_ROAD_ACTIONS:
+        return _format_cross_road(result)
+    if result.get("action") in FLOOD_EVENT_ACTIONS:
+        return _format_flood(result)
+
+    action, road_id = result["action"], result["road_id"]
+    level = format_water_level(result.get("level"))
+    if result.get("no_data"):
+        if "requested_timestamp" in result:
+            return f"No data available for {road_id} at {result['requested_timestamp']}."
+        return f"No data available for {road_id} in the specified range."
+
+    if action == "retrieve_max_water_level":
+        return f"The highest water level on {road_id} was {level} meters on {result['timestamp']}."
+    elif action == "retrieve_min_water_level":
+        return f"The minimum water level on {road_id} was {level} meters on {result['timestamp']}."
+    elif action == "retrieve_average_water_level":
+        return (f"The average water level on {road_id} was {level} meters "
+                f"(calculated from {result['start_timestamp']} to {result['end_timestamp']}).")
+    elif action == "retrieve_latest_water_level":
+        return f"The latest water level on {road_id} at {result['timestamp']} was {level} meters."
+    elif action == "retrieve_water_level":
+        if result['timestamp'] != result['requested_timestamp']:
+            return (f"Water level on {road_id} at {result['timestamp']} (closest reading to "
+                    f"{result['requested_timestamp']}) was {level} meters.")
+        return f"Water level on {road_id} at {result['timestamp']} was {level} meters."
+    elif action == "retrieve_all_water_levels":
+        return _readings_table(result)
+
+    between = f"between {result['start_timestamp']} and {result['end_timestamp']}"
+    if action == "retrieve_all_water_levels_in_range":
+        return _readings_table(result) + _range_summary_text(result)
+    elif action == "retrieve_average_water_level_in_range":
+        return (f"The average water level on {road_id} {between} was {level} meters "
+                f"(standard deviation {format_water_level(result['std'])} meters, {result['count']} readings).")
+    elif action == "retrieve_max_water_level_in_range":
+        return f"The maximum water level on {road_id} {between} was {level} meters on {result['timestamp']}."
+    elif action == "retrieve_min_water_level_in_range":
+        return f"The minimum water level on {road_id} {between} was {level} meters on {result['timestamp']}."
+    return "I couldn't understand your query. Please try rephrasing it."
+
+
+def stream_answer(store, query, fmt="text", cache=None):
+    """Yield the answer as text blocks in the given format, streaming every row of listing actions
+
+    Listing actions ignore page_size and cursor here and write their whole
+    span, STREAM_CHUNK_ROWS at a time, so memory use doesn't grow with the
+    range. Other answers come out as one block.
+    """
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}. Choose one of {', '.join(STREAM_FORMATS)}")
+    plan = compile_plan(query)
+    action = plan.action
+    if action not in LISTING_ACTIONS or plan.error is not None:
+        result = answer(store, plan, cache)
+        if fmt == "ndjson":
+            yield json.dumps(result) + "\n"
+        elif fmt == "csv":
+            out = io.StringIO()
+            writer = csv.DictWriter(out, fieldnames=list(result), extrasaction="ignore", lineterminator="\n")
+            writer.writeheader()
+            writer.writerow({field: json.dumps(value) if isinstance(value, (list, dict)) else value
+                             for field, value in result.items()})
+            yield out.getvalue()
+        else:
+            yield format_answer(result) + "\n"
+        return
+
+    # Validate and size the range from the O(1) indexes before streaming any rows
+    result = answer(store, plan.replace(page_size=1), cache)
+    if "error" in result or result.get("no_data"):
+        yield (json.dumps(result) + "\n") if fmt == "ndjson" else (format_answer(result) + "\n")
+        return
+
+    road_id = plan.road_id
+    road_json = json.dumps(road_id)
+    lo, hi = _listing_span(store, plan)
+    if fmt == "text":
+        yield _text_header(road_id)
+    elif fmt == "csv":
+        yield f"Timestamp,{road_id}\n"
+    for timestamps, levels in _reading_chunks(store, road_id, lo, hi):
+        if fmt == "text":
+            yield _text_lines(road_id, zip(timestamps, levels))
+        elif fmt == "csv":
+            yield "".join(f"{timestamp},{'' if level is None else level}\n"
+                          for timestamp, level in zip(timestamps, levels))
+        else:
+            # Same output as json.dumps per row, without its per-call overhead
+            yield "".join(f'{{"timestamp": "{timestamp}", "road_id": {road_json}, '
+                          f'"level": {"null" if level is None else repr(level)}}}\n'
+                          for timestamp, level in zip(timestamps, levels))
+    if fmt == "text" and action == "retrieve_all_water_levels_in_range":
+        yield _range_summary_text(result)[1:] + "\n"
+
+
+def write_answer(store, query, out, fmt="text", cache=None):
+    """Write stream_answer() to a file-like object as it is produced"""
+    for block in stream_answer(store, query, fmt, cache):
+        out.write(block)
@@ -0,0 +1,540 @@
+import numpy as np
+
+
+class GrowableArray:
+    """1-D array with spare capacity so appends cost amortized O(1) per item"""
+
+    def __init__(self, values, dtype=None):
+        self.data = np.array(values, dtype=dtype)
+        self.size = len(self.data)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            data = np.empty(max(needed, 2 * len(self.data), 16), dtype=self.data.dtype)
+            data[:self.size] = self.values
+            self.data = data
+        self.data[self.size:needed] = values
+        self.size = needed
+
+
+class RangeExtremumIndex:
+    """Sparse table answering range max (or min) queries over one road in O(1)
+
+    Level k holds, for every row i, the position of the extreme reading in
+    rows [i, i + 2**k). A query covers [lo, hi) with two overlapping power-of-two
+    windows. Ties resolve to the earlier row so results match the first
+    occurrence pandas would report, and missing readings never win. Appending
+    rows only fills in the new tail of each level.
+    """
+
+    def __init__(self, values, kind='max'):
+        if kind not in ('max', 'min'):
+            raise ValueError(f"Unknown extremum kind: {kind}")
+        self.kind = kind
+        self._keys = GrowableArray([], dtype=np.float64)
+        self._levels = []
+        self.extend(values)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _key(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        # Flip the sign for min so both kinds compare with >=
+        keys = values if self.kind == 'max' else -values
+        return np.where(np.isnan(keys), -np.inf, keys)
+
+    def extend(self, values):
+        """Add readings for rows appended after the ones already indexed"""
+        start = len(self._keys)
+        self._keys.extend(self._key(values))
+        n = len(self._keys)
+        keys = self._keys.values
+        if not self._levels:
+            self._levels.append(GrowableArray([], dtype=np.int64))
+        self._levels[0].extend(np.arange(start, n))
+        k, width = 1, 1
+        while 2 * width <= n:
+            if k == len(self._levels):
+                self._levels.append(GrowableArray([], dtype=np.int64))
+            prev, level = self._levels[k - 1].values, self._levels[k]
+            # Level k covers rows 0 .. n - 2**k; only entries past its old end are new
+            end = n - 2 * width + 1
+            left, right = prev[len(level):end], prev[len(level) + width:end + width]
+            level.extend(np.where(keys[left] >= keys[right], left, right))
+            k, width = k + 1, width * 2
+
+    def query(self, lo, hi):
+        """Position of the extreme reading in rows [lo, hi), or None if they are all missing"""
+        if hi <= lo:
+            return None
+        keys = self._keys.data
+        k = int(hi - lo).bit_length() - 1
+        level = self._levels[k].data
+        left, right = int(level[lo]), int(level[hi - (1 << k)])
+        position = left if keys[left] >= keys[right] else right
+        return None if keys[position] == -np.inf else position
+
+    def nbytes(self):
+        return self._keys.data.nbytes + sum(level.data.nbytes for level in self._levels)
+
+
+class PrefixAggregates:
+    """Cumulative sum, sum of squares and reading count for one road
+
+    Entry i covers rows [0, i), so any [lo, hi) window's sum, mean, variance
+    and count come from two lookups. Missing readings add nothing to any of
+    the arrays, so gaps in the sensor data never poison a window.
+    """
+
+    def __init__(self, values):
+        self._sums = GrowableArray([0.0])
+        self._squares = GrowableArray([0.0])
+        self._counts = GrowableArray([0], dtype=np.int64)
+        self.extend(values)
+
+    def __len__(self):
+        return len(self._counts) - 1
+
+    def extend(self, values):
+        """Add readings for rows appended after the ones already covered"""
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        self._sums.extend(self._sums.data[self._sums.size - 1] + np.cumsum(filled))
+        self._squares.extend(self._squares.data[self._squares.size - 1] + np.cumsum(filled * filled))
+        self._counts.extend(self._counts.data[self._counts.size - 1] + np.cumsum(present, dtype=np.int64))
+
+    def count(self, lo, hi):
+        counts = self._counts.data
+        return int(counts[hi] - counts[lo])
+
+    def sum(self, lo, hi):
+        sums = self._sums.data
+        return float(sums[hi] - sums[lo])
+
+    def mean(self, lo, hi):
+        count = self.count(lo, hi)
+        return self.sum(lo, hi) / count if count else float('nan')
+
+    def variance(self, lo, hi, ddof=1):
+        """Variance of the readings in [lo, hi), sample variance by default like pandas"""
+        count = self.count(lo, hi)
+        if count <= ddof:
+            return float('nan')
+        total = self.sum(lo, hi)
+        squares = float(self._squares.data[hi] - self._squares.data[lo])
+        return max(squares - total * total / count, 0.0) / (count - ddof)
+
+    def nbytes(self):
+        return self._sums.data.nbytes + self._squares.data.nbytes + self._counts.data.nbytes
+
+
+class FloodEventIndex:
+    """Runs of readings at or above a threshold on one road, as sorted intervals
+
+    Event i covers rows [start_pos, end_pos): its first reading at or above
+    the threshold through the last, with end_pos the row of the next reading
+    (back below, or missing). Its time span runs from the first reading to
+    that next reading, or to the latest reading while the event is still
+    ongoing. A prefix sum of durations answers time-above-threshold for any
+    window with two binary searches, and appends only extend or close the
+    last event.
+    """
+
+    FIELDS = ('start_pos', 'end_pos', 'peak_pos', 'peak', 'start_ns', 'end_ns')
+
+    def __init__(self, values, timestamps, threshold):
+        self.threshold = threshold
+        self.rows = 0
+        for field in self.FIELDS:
+            setattr(self, f'_{field}', GrowableArray([], dtype=np.float64 if field == 'peak' else np.int64))
+        # Entry i is the total duration of events [0, i)
+        self._durations = GrowableArray([0], dtype=np.int64)
+        self.extend(values, timestamps)
+
+    def __len__(self):
+        return len(self._start_pos)
+
+    def _runs(self, values):
+        """Start, end, peak position and peak of each run of readings at or above the threshold"""
+        # Missing readings compare False, so a gap ends an event
+        above = np.asarray(values, dtype=np.float64) >= self.threshold
+        edges = np.diff(np.r_[0, above.astype(np.int8), 0])
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        if not len(starts):
+            return starts, ends, starts, np.empty(0)
+        # Rows at or above the threshold, run after run, so each run is a contiguous segment
+        rows = np.flatnonzero(above)
+        levels = np.asarray(values, dtype=np.float64)[rows]
+        lengths = ends - starts
+        peaks = np.maximum.reduceat(levels, np.cumsum(lengths) - lengths)
+        # First row of each run holding its peak
+        run_of_row = np.repeat(np.arange(len(starts)), lengths)
+        hit = levels == peaks[run_of_row]
+        peak_pos = np.full(len(starts), len(values), dtype=np.int64)
+        np.minimum.at(peak_pos, run_of_row[hit], rows[hit])
+        return starts, ends, peak_pos, peaks
+
+    def extend(self, values, timestamps):
+        """Add readings (with their int64 timestamps) for rows appended after the ones already indexed"""
+        values = np.asarray(values, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        offset = self.rows
+        self.rows += len(values)
+        if not len(values):
+            return
+        starts, ends, peak_pos, peaks = self._runs(values)
+
+        if len(self) and self._end_pos.data[len(self) - 1] == offset:
+            last = len(self) - 1
+            if len(starts) and starts[0] == 0:
+                # The ongoing event carries on into the new rows; an equal peak keeps the earlier one
+                if peaks[0] > self._peak.data[last]:
+                    self._peak.data[last] = peaks[0]
+                    self._peak_pos.data[last] = peak_pos[0] + offset
+                self._end_pos.data[last] = ends[0] + offset
+                self._set_end(last, timestamps, ends[0])
+                starts, ends, peak_pos, peaks = starts[1:], ends[1:], peak_pos[1:], peaks[1:]
+            else:
+                # It ended at the first appended reading
+                self._set_end(last, timestamps, 0)
+
+        if not len(starts):
+            return
+        end_ns = np.where(ends < len(values), timestamps[np.minimum(ends, len(values) - 1)],
+                          timestamps[ends - 1])
+        start_ns = timestamps[starts]
+        self._start_pos.extend(starts + offset)
+        self._end_pos.extend(ends + offset)
+        self._peak_pos.extend(peak_pos + offset)
+        self._peak.extend(peaks)
+        self._start_ns.extend(start_ns)
+        self._end_ns.extend(end_ns)
+        self._durations.extend(self._durations.data[self._durations.size - 1] + np.cumsum(end_ns - start_ns))
+
+    def _set_end(self, i, timestamps, end):
+        """Set event i's end time from the appended rows, given its end row within them"""
+        end_ns = int(timestamps[end]) if end < len(timestamps) else int(timestamps[-1])
+        change = end_ns - int(self._end_ns.data[i])
+        self._end_ns.data[i] = end_ns
+        # Only the last event can change, so only the last prefix entry moves
+        self._durations.data[i + 1] += change
+
+    def event(self, i):
+        """Event i as a dict of its rows, times, peak and whether it is still ongoing"""
+        event = {field: getattr(self, f'_{field}').data[i].item() for field in self.FIELDS}
+        event['duration_ns'] = event['end_ns'] - event['start_ns']
+        event['ongoing'] = event['end_pos'] == self.rows
+        return event
+
+    def overlapping(self, start_ns=None, end_ns=None):
+        """[i, j) range of events overlapping the inclusive time window, found by binary search"""
+        n = len(self)
+        i = 0 if start_ns is None else int(np.searchsorted(self._end_ns.values, start_ns, side='right'))
+        j = n if end_ns is None else int(np.searchsorted(self._start_ns.values, end_ns, side='right'))
+        # An event ending exactly at start_ns only touches the window when it is a single reading
+        while i > 0 and self._end_ns.data[i - 1] == start_ns and self._start_ns.data[i - 1] == start_ns:
+            i -= 1
+        return i, max(i, j)
+
+    def time_above(self, start_ns=None, end_ns=None):
+        """Nanoseconds spent at or above the threshold within the window"""
+        i, j = self.overlapping(start_ns, end_ns)
+        if i == j:
+            return 0
+        durations = self._durations.data
+        total = int(durations[j] - durations[i])
+        # Clip the two edge events to the window
+        if start_ns is not None:
+            total -= max(0, start_ns - int(self._start_ns.data[i]))
+        if end_ns is not None:
+            total -= max(0, int(self._end_ns.data[j - 1]) - end_ns)
+        return max(total, 0)
+
+    def longest(self, start_ns=None, end_ns=None):
+        """Event with the longest duration (clipped to the window) among those overlapping it, or None"""
+        i, j = self.overlapping(start_ns, end_ns)
+        if i == j:
+            return None
+        starts, ends = self._start_ns.values[i:j], self._end_ns.values[i:j]
+        if start_ns is not None:
+            starts = np.maximum(starts, start_ns)
+        if end_ns is not None:
+            ends = np.minimum(ends, end_ns)
+        return i + int(np.argmax(ends - starts))
+
+
+DAY_NS = 86400 * 10**9
+# Finest to coarsest; weeks start on Monday
+ROLLUP_LEVELS = ('day', 'week', 'month')
+ROLLUP_FIELDS = ('min', 'max', 'min_pos', 'max_pos', 'sum', 'squares', 'count',
+                 'first', 'first_pos', 'last', 'last_pos')
+
+
+def bucket_ids(level, timestamps):
+    """Calendar bucket number of each int64 epoch-ns timestamp at a rollup level"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    days = timestamps // DAY_NS
+    if level == 'day':
+        return days
+    if level == 'week':
+        # 1970-01-01 was a Thursday
+        return (days + 3) // 7
+    return timestamps.astype('datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+
+
+def row_aggregates(values, offset=0):
+    """Rollup fields for each single reading, positions counted from offset"""
+    values = np.asarray(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    positions = np.where(present, np.arange(offset, offset + len(values)), -1)
+    filled = np.where(present, values, 0.0)
+    return {
+        'min': values, 'max': values, 'min_pos': positions, 'max_pos': positions,
+        'sum': filled, 'squares': filled * filled, 'count': present.astype(np.int64),
+        'first': values, 'first_pos': positions, 'last': values, 'last_pos': positions,
+    }
+
+
+def reduce_aggregates(parts, starts):
+    """Merge consecutive groups of rollup entries, each group starting at an index in starts
+
+    Entries are in row order, so the first entry holding a group's extreme
+    also holds its earliest occurrence; gaps never win a min, max, first or last.
+    """
+    n = len(parts['count'])
+    starts = np.asarray(starts, dtype=np.int64)
+    group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+    index = np.arange(n)
+    merged = {field: np.add.reduceat(parts[field], starts) for field in ('sum', 'squares', 'count')}
+    for kind, reduce in (('min', np.fmin), ('max', np.fmax)):
+        best = reduce.reduceat(parts[kind], starts)
+        # NaN never equals anything, so empty entries are never picked
+        first_hit = np.minimum.reduceat(np.where(parts[kind] == best[group], index, n), starts)
+        merged[kind] = best
+        merged[f'{kind}_pos'] = np.where(first_hit < n, parts[f'{kind}_pos'][np.minimum(first_hit, n - 1)], -1)
+    present = parts['count'] > 0
+    first = np.minimum.reduceat(np.where(present, index, n), starts)
+    last = np.maximum.reduceat(np.where(present, index, -1), starts)
+    merged['first'] = np.where(first < n, parts['first'][np.minimum(first, n - 1)], np.nan)
+    merged['first_pos'] = np.where(first < n, parts['first_pos'][np.minimum(first, n - 1)], -1)
+    merged['last'] = np.where(last >= 0, parts['last'][last], np.nan)
+    merged['last_pos'] = np.where(last >= 0, parts['last_pos'][last], -1)
+    return merged
+
+
+class RollupPyramid:
+    """Daily, weekly and monthly min/max/sum/count/first/last rollups for one road
+
+    Each level keeps one entry per calendar bucket with the row its bucket
+    starts at. A range query is planned top down: the coarsest buckets that
+    fit wholly inside it, then finer buckets for the two leftovers, then raw
+    rows at the very edges. A five-year window is about 60 months plus a few
+    weeks, days and hours at each end, and the result is exactly what a scan
+    of the rows gives (sums up to float rounding). Appends merge into the
+    last day and rebuild only the last week and month from their days.
+    """
+
+    def __init__(self, values, timestamps):
+        self.rows = 0
+        self._levels = {}
+        self.extend(values, timestamps)
+
+    def extend(self, values, timestamps):
+        """Add readings (with their int64 timestamps) for rows appended after the ones already rolled up"""
+        values = np.asarray(values, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        offset = self.rows
+        self.rows += len(values)
+        if not len(values):
+            return
+
+        # Days merge the new rows into the last day, which needs only its aggregate
+        parts = row_aggregates(values, offset)
+        ids = bucket_ids('day', timestamps)
+        row_starts = np.arange(offset, offset + len(values))
+        day = self._levels.get('day')
+        keep = None
+        if day is not None and day['ids'][-1] == ids[0]:
+            keep = len(day['ids']) - 1
+            parts = {field: np.r_[day[field][-1:], parts[field]] for field in ROLLUP_FIELDS}
+            ids = np.r_[day['ids'][-1:], ids]
+            row_starts = np.r_[day['row_starts'][-1:], row_starts]
+        self._replace('day', keep, parts, ids, row_starts)
+
+        # Weeks and months are rebuilt from their days, starting at their last bucket
+        day = self._levels['day']
+        day_timestamps = day['ids'] * DAY_NS
+        for level in ROLLUP_LEVELS[1:]:
+            current = self._levels.get(level)
+            restart = 0 if current is None else int(current['child_starts'][-1])
+            keep = None if current is None else len(current['ids']) - 1
+            parts = {field: day[field][restart:] for field in ROLLUP_FIELDS}
+            self._replace(level, keep, parts, bucket_ids(level, day_timestamps[restart:]),
+                          day['row_starts'][restart:], child_offset=restart)
+
+    def _replace(self, level, keep, parts, ids, row_starts, child_offset=None):
+        """Reduce parts into buckets by id and put them in place of the level's entries from keep on"""
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        merged = reduce_aggregates(parts, starts)
+        merged['ids'] = ids[starts]
+        merged['row_starts'] = row_starts[starts]
+        # Index of each bucket's first entry one level down; raw rows for days
+        merged['child_starts'] = merged['row_starts'] if child_offset is None else starts + child_offset
+        current = self._levels.get(level)
+        if current is not None:
+            keep = len(current['ids']) if keep is None else keep
+            merged = {field: np.r_[current[field][:keep], merged[field]] for field in merged}
+        self._levels[level] = merged
+
+    def plan(self, lo, hi, level=len(ROLLUP_LEVELS) - 1):
+        """Pieces covering rows [lo, hi): ('raw', lo, hi) or (level, first bucket, end bucket), in row order"""
+        if lo >= hi:
+            return []
+        if level < 0:
+            return [('raw', lo, hi)]
+        name = ROLLUP_LEVELS[level]
+        row_starts = self._levels[name]['row_starts']
+        first = int(np.searchsorted(row_starts, lo, side='left'))
+        # Buckets ending at or before hi; bucket b ends where b + 1 starts
+        end = int(np.searchsorted(row_starts, hi, side='right')) - 1
+        if hi >= self.rows:
+            end = len(row_starts)
+        if first >= end:
+            return self.plan(lo, hi, level - 1)
+        covered_hi = int(row_starts[end]) if end < len(row_starts) else self.rows
+        return (self.plan(lo, int(row_starts[first]), level - 1) + [(name, first, end)] +
+                self.plan(covered_hi, hi, level - 1))
+
+    def query(self, values, lo, hi):
+        """Min, max, sum, count, first and last (with positions) of rows [lo, hi) of the values given"""
+        pieces = []
+        for kind, start, end in self.plan(lo, hi):
+            if kind == 'raw':
+                pieces.append(row_aggregates(values[start:end], start))
+            else:
+                level = self._levels[kind]
+                pieces.append({field: level[field][start:end] for field in ROLLUP_FIELDS})
+        if not pieces:
+            return {field: (-1 if field.endswith('_pos') else 0 if field in ('sum', 'squares', 'count')
+                            else float('nan')) for field in ROLLUP_FIELDS}
+        merged = reduce_aggregates({field: np.concatenate([piece[field] for piece in pieces])
+                                    for field in ROLLUP_FIELDS}, [0])
+        return {field: merged[field][0].item() for field in ROLLUP_FIELDS}
+
+    def levels(self):
+        """Number of buckets at each level"""
+        return {level: len(self._levels[level]['ids']) for level in ROLLUP_LEVELS if level in self._levels}
+
+    def nbytes(self):
+        return sum(array.nbytes for level in self._levels.values() for array in level.values())
+
+
+class RoadSummaries:
+    """Whole-history min, max, mean, count and latest reading for every road
+
+    Built with one vectorized pass over the timestamps x roads matrix, a
+    block of roads at a time, so whole-history actions never rescan a column.
+    Positions are row numbers, -1 where a road has no readings at all.
+    """
+
+    FIELDS = ('min', 'max', 'min_pos', 'max_pos', 'sum', 'count', 'latest', 'latest_pos')
+
+    def __init__(self, road_ids, **arrays):
+        self.road_ids = list(road_ids)
+        self._positions = {road: i for i, road in enumerate(self.road_ids)}
+        for field in self.FIELDS:
+            setattr(self, field, arrays[field])
+
+    @classmethod
+    def from_columns(cls, road_ids, column, block_roads=256):
+        """Summarize every road, reading columns through column(road_id)"""
+        road_ids = list(road_ids)
+        parts = []
+        for start in range(0, len(road_ids), block_roads):
+            block = road_ids[start:start + block_roads]
+            parts.append(cls._summarize(np.column_stack([column(road) for road in block])))
+        arrays = {field: np.concatenate([part[field] for part in parts]) if parts else np.empty(0)
+                  for field in cls.FIELDS}
+        return cls(road_ids, **arrays)
+
+    @staticmethod
+    def _summarize(matrix):
+        present = ~np.isnan(matrix)
+        count = present.sum(axis=0)
+        empty = count == 0
+        # argmax/argmin return the first occurrence once gaps can no longer win
+        max_pos = np.where(empty, -1, np.argmax(np.where(present, matrix, -np.inf), axis=0))
+        min_pos = np.where(empty, -1, np.argmin(np.where(present, matrix, np.inf), axis=0))
+        latest_pos = np.where(empty, -1, len(matrix) - 1 - np.argmax(present[::-1], axis=0))
+        columns = np.arange(matrix.shape[1])
+        return {
+            'min': np.where(empty, np.nan, matrix[np.maximum(min_pos, 0), columns]),
+            'max': np.where(empty, np.nan, matrix[np.maximum(max_pos, 0), columns]),
+            'min_pos': min_pos,
+            'max_pos': max_pos,
+            'sum': np.where(present, matrix, 0.0).sum(axis=0),
+            'count': count,
+            'latest': np.where(empty, np.nan, matrix[np.maximum(latest_pos, 0), columns]),
+            'latest_pos': latest_pos,
+        }
+
+    def add_roads(self, road_ids):
+        """Add roads that have no readings yet"""
+        road_ids = [road for road in road_ids if road not in self._positions]
+        for road in road_ids:
+            self._positions[road] = len(self.road_ids)
+            self.road_ids.append(road)
+        empty = {'min': np.nan, 'max': np.nan, 'min_pos': -1, 'max_pos': -1,
+                 'sum': 0.0, 'count': 0, 'latest': np.nan, 'latest_pos': -1}
+        for field in self.FIELDS:
+            current = getattr(self, field)
+            setattr(self, field, np.concatenate([current, np.full(len(road_ids), empty[field], dtype=current.dtype)]))
+
+    def extend(self, matrix, offset):
+        """Fold appended rows (a rows x roads block, in road_ids order) starting at row offset"""
+        block = self._summarize(matrix)
+        has_readings = block['count'] > 0
+        # Only a strictly better reading replaces the old extreme, keeping first occurrences
+        for kind, better in (('max', np.greater), ('min', np.less)):
+            current = getattr(self, kind)
+            replace = has_readings & ((self.count == 0) | better(block[kind], current))
+            current[replace] = block[kind][replace]
+            getattr(self, f'{kind}_pos')[replace] = block[f'{kind}_pos'][replace] + offset
+        self.latest[has_readings] = block['latest'][has_readings]
+        self.latest_pos[has_readings] = block['latest_pos'][has_readings] + offset
+        self.sum = self.sum + block['sum']
+        self.count = self.count + block['count']
+
+    def save(self, path):
+        np.savez(path, road_ids=np.array(self.road_ids), **{field: getattr(self, field) for field in self.FIELDS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['road_ids'].tolist(), **{field: data[field] for field in cls.FIELDS})
+
+    def get(self, road_id):
+        """Summary of one road as a dict, with None for positions it has no reading at"""
+        i = self._positions[road_id]
+        count = int(self.count[i])
+        summary = {
+            'min': float(self.min[i]),
+            'max': float(self.max[i]),
+            'mean': float(self.sum[i]) / count if count else float('nan'),
+            'count': count,
+            'latest': float(self.latest[i]),
+        }
+        for field in ('min_pos', 'max_pos', 'latest_pos'):
+            summary[field] = int(getattr(self, field)[i]) if count else None
+        return summary
@@ -0,0 +1,77 @@
+import io
+import os
+import threading
+
+import pandas as pd
+
+# Live ingestion: new hourly rows reach the in-memory store (and every index
+# built on it) through WaterStore.append, either directly or by tailing the CSV.
+FOLLOW_INTERVAL = 5.0
+
+
+def append_rows(store, rows):
+    """Append readings given as a DataFrame or a list of {'Timestamp': ..., 'Road_N': ...} dicts"""
+    if not isinstance(rows, pd.DataFrame):
+        rows = pd.DataFrame(list(rows))
+    rows = rows.assign(Timestamp=pd.to_datetime(rows['Timestamp']))
+    return store.append(rows)
+
+
+class CsvFollower:
+    """Tails a CSV file that is being appended to and feeds complete new lines into a store
+
+    Starts at the current end of the file, since the store was loaded from it.
+    If the file is truncated or its header changes (for example regenerated with
+    new roads), it is read again from the top; rows the store already holds are
+    skipped by WaterStore.append.
+    """
+
+    def __init__(self, store, csv_path, interval=FOLLOW_INTERVAL, from_start=False):
+        self.store = store
+        self.csv_path = csv_path
+        self.interval = interval
+        self.appended = 0
+        self._header = self._read_header()
+        self._offset = len(self._header) if from_start else os.path.getsize(csv_path)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read_header(self):
+        with open(self.csv_path, 'rb') as f:
+            return f.readline()
+
+    def poll(self):
+        """Append any complete lines written since the last poll and return how many rows were added"""
+        header = self._read_header()
+        if header != self._header or os.path.getsize(self.csv_path) < self._offset:
+            self._header, self._offset = header, len(header)
+        with open(self.csv_path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        # A line still being written has no newline yet; leave it for the next poll
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            return 0
+        self._offset += end
+        rows = pd.read_csv(io.BytesIO(self._header + chunk[:end]), parse_dates=['Timestamp'])
+        appended = self.store.append(rows)
+        self.appended += appended
+        return appended
+
+    def start(self):
+        """Poll in a background thread until stop() is called"""
+        self._thread = threading.Thread(target=self._run, name="csv-follower", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error following {self.csv_path}: {str(e)}")
@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from water_cross import METRICS, TOP_ROADS, history_stats, window_stats
+from water_index import ROLLUP_FIELDS, reduce_aggregates, row_aggregates
+from water_store import CONVERT_CHUNK_ROWS, MANIFEST_FILE, convert_csv, open_store
+
+# Time-partitioned store: the timeline split into one columnar store per
+# calendar month (each laid out as in water_store), under a manifest of every
+# shard's time bounds and per-road min, max and reading count. A range query
+# opens only the shards overlapping it, skips those the manifest rules out,
+# and aggregates the rest in a process pool, one shard per task; the partial
+# results merge like rollup buckets, so answers match a single store's.
+#
+# ShardedStore is a library API for multi-year histories: it answers range
+# summaries and cross-road queries only, not the whole WaterStore interface,
+# so water_engine and the CLI, HTTP and batch front ends do not use it.
+# Running this module builds the shards (see main).
+#
+#   <name>.shards/manifest.json   roads, source CSV and the shard list
+#   <name>.shards/<period>/       one columnar store per period, e.g. 2024-10
+SHARD_FREQ = 'M'
+# Ranges overlapping fewer shards than this are aggregated in-process, where a pool costs more than it saves
+PARALLEL_MIN_SHARDS = 4
+POSITION_FIELDS = ('min_pos', 'max_pos', 'first_pos', 'last_pos')
+# Fixed so a part holding only midnight rows still writes times, and every part parses alike
+PART_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+# Shards each process keeps open; they are memory-mapped, so this holds file handles, not readings
+OPEN_SHARDS = 256
+
+_open_shards = {}
+
+
+def sharded_path(csv_path):
+    """Directory holding the time-partitioned copy of a CSV file"""
+    return os.path.splitext(csv_path)[0] + ".shards"
+
+
+def _json_levels(values):
+    # JSON has no NaN, so roads without readings in a shard get null
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def partition_csv(csv_path, out_dir=None, freq=SHARD_FREQ, chunk_rows=CONVERT_CHUNK_ROWS, quantize_roads=False):
+    """One-time split of a wide CSV into a columnar store per period, plus the shard manifest"""
+    out_dir = out_dir or sharded_path(csv_path)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_file = os.path.join(out_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+    parts_dir = os.path.join(out_dir, "parts")
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+
+    # Rows go to one CSV per period first, so an unsorted CSV never needs more than a chunk in memory
+    names = set()
+    for chunk in pd.read_csv(csv_path, parse_dates=['Timestamp'], chunksize=chunk_rows):
+        periods = chunk['Timestamp'].dt.to_period(freq).astype(str)
+        for name, rows in chunk.groupby(periods, sort=False):
+            rows.to_csv(os.path.join(parts_dir, f"{name}.csv"), mode='a', header=name not in names, index=False,
+                        date_format=PART_DATE_FORMAT)
+            names.add(name)
+
+    road_ids = [col for col in pd.read_csv(csv_path, nrows=0).columns if col.startswith('Road_')]
+    shards = []
+    # Period names are fixed width, so sorting them sorts the shards in time
+    for name in sorted(names):
+        part = os.path.join(parts_dir, f"{name}.csv")
+        store = open_store(convert_csv(part, os.path.join(out_dir, name), chunk_rows, quantize_roads))
+        os.remove(part)
+        summaries = store.summaries()
+        shards.append({
+            'name': name,
+            'rows': len(store),
+            'start': int(store.timestamps[0]),
+            'end': int(store.timestamps[-1]),
+            'min': _json_levels(summaries.min),
+            'max': _json_levels(summaries.max),
+            'count': summaries.count.tolist(),
+        })
+        del store
+    os.rmdir(parts_dir)
+
+    # Manifest goes last so a half-written partition is never opened
+    manifest = {
+        'roads': road_ids,
+        'freq': freq,
+        'source': os.path.basename(csv_path),
+        'source_mtime': os.path.getmtime(csv_path),
+        'shards': shards,
+    }
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f)
+    return out_dir
+
+
+def _shard(directory):
+    """Columnar store of one shard, opened once per process"""
+    store = _open_shards.pop(directory, None)
+    if store is None:
+        store = open_store(directory)
+        if len(_open_shards) >= OPEN_SHARDS:
+            del _open_shards[next(iter(_open_shards))]
+    # Reinserted so the least recently used shard is first in line to close
+    _open_shards[directory] = store
+    return store
+
+
+def _road_partial(directory, road_id, start, end):
+    """Rollup fields of one road over a shard's rows in [start, end], with timestamps for positions"""
+    store = _shard(directory)
+    lo, hi = store.slice_range(start, end)
+    if lo == hi:
+        return hi - lo, None
+    merged = reduce_aggregates(row_aggregates(store.column(road_id)[lo:hi], lo), [0])
+    part = {field: merged[field][0].item() for field in ROLLUP_FIELDS}
+    # Row numbers are local to the shard; timestamps stay ordered across shards
+    for field in POSITION_FIELDS:
+        part[field] = int(store.timestamps[part[field]]) if part[field] >= 0 else -1
+    return hi - lo, part
+
+
+def _window_partial(directory, start, end):
+    """Per-road max, its timestamp, sum and count over a shard's rows in [start, end]"""
+    store = _shard(directory)
+    lo, hi = store.slice_range(start, end)
+    # A shard the window covers whole is answered from its summary without reading rows
+    stats = history_stats(store) if (lo, hi) == (0, len(store)) else window_stats(store, lo, hi)
+    max_ns = np.where(stats['count'] > 0, np.asarray(store.timestamps)[np.maximum(stats['max_pos'], 0)], -1)
+    return {'max': stats['max'], 'max_ns': max_ns, 'sum': stats['sum'], 'count': stats['count']}
+
+
+class ShardedStore:
+    """Time-partitioned columnar stores behind one manifest, aggregated a shard per worker process"""
+
+    def __init__(self, directory, workers=None):
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        self.directory = directory
+        self.road_ids = manifest['roads']
+        self._positions = {road: i for i, road in enumerate(self.road_ids)}
+        self.shards = manifest['shards']
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+
+    def __len__(self):
+        return sum(shard['rows'] for shard in self.shards)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def has_road(self, road_id):
+        return road_id in self._positions
+
+    def first_timestamp(self):
+        return pd.Timestamp(self.shards[0]['start'])
+
+    def last_timestamp(self):
+        return pd.Timestamp(self.shards[-1]['end'])
+
+    def _bounds(self, start, end):
+        start = pd.Timestamp(start) if start is not None else self.first_timestamp()
+        end = pd.Timestamp(end) if end is not None else self.last_timestamp()
+        return start, end
+
+    def shards_for(self, start=None, end=None):
+        """Shards whose time bounds overlap [start, end], in time order"""
+        start, end = self._bounds(start, end)
+        start_ns, end_ns = start.as_unit('ns').value, end.as_unit('ns').value
+        return [shard for shard in self.shards if shard['start'] <= end_ns and shard['end'] >= start_ns]
+
+    def _covers(self, shard, start, end):
+        return start.as_unit('ns').value <= shard['start'] and shard['end'] <= end.as_unit('ns').value
+
+    def _map(self, function, shards, *args):
+        """function(shard directory, *args) for every shard, in a process pool when there are enough of them"""
+        directories = [os.path.join(self.directory, shard['name']) for shard in shards]
+        if self.workers <= 1 or len(directories) < PARALLEL_MIN_SHARDS:
+            return [function(directory, *args) for directory in directories]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        return list(self._pool.map(function, directories, *([arg] * len(directories) for arg in args)))
+
+    def range_summary(self, road_id, start, end):
+        """Count, sum, mean, spread and extremes of one road's readings in a time range, as WaterStore gives"""
+        start, end = self._bounds(start, end)
+        road = self._positions[road_id]
+        rows, shards = 0, []
+        for shard in self.shards_for(start, end):
+            # Whole shards where the road has no readings add only their row count
+            if not shard['count'][road] and self._covers(shard, start, end):
+                rows += shard['rows']
+            else:
+                shards.append(shard)
+        parts = []
+        for shard_rows, part in self._map(_road_partial, shards, road_id, start, end):
+            rows += shard_rows
+            if part is not None:
+                parts.append(part)
+
+        summary = {'rows': rows}
+        if parts:
+            merged = reduce_aggregates({field: np.array([part[field] for part in parts]) for field in ROLLUP_FIELDS},
+                                       [0])
+            merged = {field: merged[field][0].item() for field in ROLLUP_FIELDS}
+        else:
+            merged = {'sum': 0.0, 'squares': 0.0, 'count': 0}
+        count, total = merged['count'], merged['sum']
+        summary.update(
+            count=count,
+            sum=total,
+            mean=total / count if count else float('nan'),
+            # Sample variance, matching WaterStore.range_summary
+            variance=max(merged['squares'] - total * total / count, 0.0) / (count - 1) if count > 1 else float('nan'),
+        )
+        for kind in ('min', 'max', 'first', 'last'):
+            summary[kind] = merged[kind] if count else float('nan')
+            summary[f'{kind}_timestamp'] = pd.Timestamp(merged[f'{kind}_pos']) if count else None
+        return summary
+
+    def window_stats(self, start=None, end=None, threshold=None):
+        """Per-road max, its timestamp, sum, mean and count over a time range, as arrays in road_ids order
+
+        With threshold, shards where the manifest shows no road reaching it are
+        skipped, so maxima below the threshold may be missing.
+        """
+        start, end = self._bounds(start, end)
+        shards = self.shards_for(start, end)
+        if threshold is not None:
+            shards = [shard for shard in shards
+                      if any(level is not None and level >= threshold for level in shard['max'])]
+        roads = len(self.road_ids)
+        best = np.full(roads, np.nan)
+        best_ns = np.full(roads, -1, dtype=np.int64)
+        total = np.zeros(roads)
+        count = np.zeros(roads, dtype=np.int64)
+        for part in self._map(_window_partial, shards, start, end):
+            # Shards come in time order, so strictly greater keeps the first occurrence
+            better = (part['count'] > 0) & ((count == 0) | (part['max'] > best))
+            best[better] = part['max'][better]
+            best_ns[better] = part['max_ns'][better]
+            total += part['sum']
+            count += part['count']
+        return {
+            'max': best,
+            'max_ns': best_ns,
+            'sum': total,
+            'mean': np.where(count > 0, total / np.maximum(count, 1), np.nan),
+            'count': count,
+        }
+
+    def roads_above(self, threshold, start=None, end=None):
+        """Roads whose highest reading in a time range is at or above threshold, highest first,
+        as (road, level, timestamp) tuples"""
+        stats = self.window_stats(start, end, threshold)
+        levels = stats['max']
+        hits = np.flatnonzero(levels >= threshold)
+        hits = hits[np.argsort(-levels[hits], kind='stable')]
+        return [(self.road_ids[i], float(levels[i]), pd.Timestamp(int(stats['max_ns'][i]))) for i in hits]
+
+    def top_roads(self, k=TOP_ROADS, metric='max', start=None, end=None):
+        """The k roads with the highest max or mean level, as (road, value, timestamp of the max or None) tuples"""
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}. Choose one of {', '.join(METRICS)}")
+        stats = self.window_stats(start, end)
+        values = stats[metric]
+        keys = np.where(np.isnan(values), -np.inf, values)
+        k = min(k, int(np.count_nonzero(~np.isnan(values))))
+        if k <= 0:
+            return []
+        top = np.argsort(-keys, kind='stable')[:k]
+        return [(self.road_ids[i], float(values[i]),
+                 pd.Timestamp(int(stats['max_ns'][i])) if metric == 'max' else None) for i in top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a water level CSV into time-partitioned columnar shards")
+    parser.add_argument("csv", nargs="*", default=["road_water_levels_large.csv"])
+    parser.add_argument("--freq", default=SHARD_FREQ, help="pandas period per shard, e.g. M or Y")
+    parser.add_argument("--quantize", action="store_true", help="store each shard's roads as int16 codes")
+    args = parser.parse_args()
+    for path in args.csv:
+        print(f"Partitioned {path} -> {partition_csv(path, freq=args.freq, quantize_roads=args.quantize)}")
+
+
+if __name__ == "__main__":
+    main()
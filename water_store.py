@@ -0,0 +1,694 @@
+import json
+import os
+import sys
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from water_index import (FloodEventIndex, GrowableArray, PrefixAggregates, RangeExtremumIndex, RoadSummaries,
+                         RollupPyramid)
+
+# Layout of a columnar store directory:
+#   manifest.json   row count, road ids, the CSV it was converted from and the
+#                   decimals of every road stored as fixed-point codes
+#   Timestamp.npy   int64 epoch nanoseconds, sorted ascending
+#   Road_<N>.npy    one contiguous array per road: float64, or int16 codes
+#                   when the road is quantized (see quantize)
+#   summary.npz     per-road whole-history summaries (see RoadSummaries)
+MANIFEST_FILE = "manifest.json"
+TIMESTAMP_FILE = "Timestamp.npy"
+SUMMARY_FILE = "summary.npz"
+CONVERT_CHUNK_ROWS = 100_000
+# How many appends are remembered for cache invalidation (see WaterStore.append_log)
+APPEND_LOG_SIZE = 1024
+# Rows per cached row-major block behind WaterStore.row_block, so reading a few
+# rows of every road doesn't gather from each road's column
+ROW_CACHE_ROWS = 32
+# How far an as-of lookup may drift from the requested time
+ASOF_TOLERANCE = '1h'
+# Index behind range_summary: "sparse" uses per-row prefix sums and sparse tables,
+# O(1) per query at any span but with n log n entries per road; "rollup" plans over
+# daily/weekly/monthly buckets and stays ~50x smaller, at several times the latency
+# (most of all on short windows, which are mostly raw edges). See bench_rollups.py
+RANGE_INDEX = "sparse"
+# Quantized roads hold readings as int16 codes with value = code / 10**decimals
+# and MISSING_CODE for gaps: 2 bytes a reading instead of 8. Millimetres cover
+# +-32.767 m; a road gets the finest of QUANTIZED_DECIMALS that stores every
+# reading exactly, and stays float64 if none does
+QUANTIZED_DTYPE = np.int16
+MISSING_CODE = np.iinfo(QUANTIZED_DTYPE).min
+MAX_CODE = np.iinfo(QUANTIZED_DTYPE).max
+QUANTIZED_DECIMALS = (3, 2, 1, 0)
+
+
+def columnar_path(csv_path):
+    """Directory holding the columnar copy of a CSV file"""
+    return os.path.splitext(csv_path)[0] + ".cols"
+
+
+def to_epoch_ns(values):
+    """Convert timestamps (strings, datetimes or a Series) to int64 epoch nanoseconds"""
+    return pd.to_datetime(values).values.astype('datetime64[ns]').astype(np.int64)
+
+
+def timestamp_ns(value):
+    """Convert a single timestamp to int64 epoch nanoseconds"""
+    return pd.Timestamp(value).as_unit('ns').value
+
+
+def dequantize(codes, decimals):
+    """Float readings for int16 codes, NaN where a reading is missing"""
+    codes = np.asarray(codes)
+    # Dividing by the power of ten yields exactly the float the decimal text parses to
+    values = codes / 10**decimals
+    values[codes == MISSING_CODE] = np.nan
+    return values
+
+
+def quantize(values, decimals):
+    """int16 codes for readings at a number of decimals, or None unless every reading round-trips exactly"""
+    values = np.asarray(values, dtype=np.float64)
+    present = ~np.isnan(values)
+    scaled = np.round(np.where(present, values, 0.0) * 10**decimals)
+    if np.any(np.abs(scaled) > MAX_CODE):
+        return None
+    codes = np.where(present, scaled, MISSING_CODE).astype(QUANTIZED_DTYPE)
+    if not np.array_equal(dequantize(codes[present], decimals), values[present]):
+        return None
+    return codes
+
+
+def quantize_column(values, decimals=QUANTIZED_DECIMALS):
+    """(codes, decimals) at the finest of decimals storing the readings exactly, or (None, None)"""
+    for places in decimals:
+        codes = quantize(values, places)
+        if codes is not None:
+            return codes, places
+    return None, None
+
+
+def threshold_codes(threshold, decimals):
+    """Per-road code a reading must reach to be at or above threshold, for integer comparisons"""
+    scale = 10.0 ** np.asarray(decimals)
+    codes = np.ceil(threshold * scale)
+    # threshold * scale can round either way, so settle on the decoded boundary
+    codes = np.where((codes - 1) / scale >= threshold, codes - 1, codes)
+    codes = np.where(codes / scale < threshold, codes + 1, codes)
+    # Never at or below MISSING_CODE, so gaps are never counted
+    return np.clip(codes, MISSING_CODE + 1, MAX_CODE + 1).astype(np.int32)
+
+
+class QuantizedColumn:
+    """One road's int16 codes behind the float interface of a column, decoding only what is read"""
+
+    dtype = np.dtype(np.float64)
+
+    def __init__(self, codes, decimals):
+        self.codes = codes
+        self.decimals = decimals
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def __getitem__(self, key):
+        codes = self.codes[key]
+        if np.ndim(codes) == 0:
+            return np.float64(np.nan) if codes == MISSING_CODE else np.float64(codes / 10**self.decimals)
+        return dequantize(codes, self.decimals)
+
+    def __array__(self, dtype=None, copy=None):
+        values = dequantize(self.codes, self.decimals)
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+
+class WaterStore:
+    """Timestamps plus one float column per road, loaded column by column
+
+    Roads listed in encoding (road id -> decimals) are loaded as int16 codes and
+    read through QuantizedColumn; cross-road scans work on their codes directly.
+    """
+
+    def __init__(self, timestamps, road_ids, load_column, summaries=None, encoding=None):
+        self.timestamps = timestamps
+        self.road_ids = list(road_ids)
+        self._road_set = set(self.road_ids)
+        self._load_column = load_column
+        self.encoding = dict(encoding or {})
+        self._columns = {}
+        self._indexes = {}
+        self._summaries = summaries
+        # Growable copies of the arrays, created by the first append
+        self._timestamp_buffer = None
+        self._buffers = None
+        # Bumped on every append so caches can tell the data has moved on. The log
+        # keeps (version, first appended timestamp, roads with new readings) per append
+        self.version = 0
+        self.append_log = deque(maxlen=APPEND_LOG_SIZE)
+        self.lock = threading.RLock()
+        # (first row, rows x roads block) of one ROW_CACHE_ROWS-aligned span of rows
+        self._row_cache = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def has_road(self, road_id):
+        return road_id in self._road_set
+
+    def column(self, road_id):
+        """Return the readings for one road, paging the column in on first use"""
+        values = self._columns.get(road_id)
+        if values is None:
+            if road_id not in self._road_set:
+                raise KeyError(road_id)
+            values = self._load_column(road_id)
+            if road_id in self.encoding:
+                values = QuantizedColumn(values, self.encoding[road_id])
+            self._columns[road_id] = values
+        return values
+
+    @property
+    def quantized(self):
+        """True when every road is stored as int16 codes, so scans can stay in integers"""
+        return bool(self.road_ids) and len(self.encoding) == len(self.road_ids)
+
+    def road_decimals(self):
+        """Decimals of each quantized road, in road_ids order"""
+        return np.array([self.encoding[road] for road in self.road_ids], dtype=np.int64)
+
+    def nbytes(self):
+        """Bytes held by the readings of the roads paged in so far"""
+        return sum(values.nbytes for values in self._columns.values())
+
+    def append(self, rows):
+        """Append newer readings and update every index built so far, without a reload
+
+        rows is a DataFrame with a Timestamp column and Road_N columns. Rows not
+        newer than the latest reading already held are skipped, and roads seen
+        for the first time are backfilled with missing readings. Returns the
+        number of rows appended.
+        """
+        with self.lock:
+            rows = rows.sort_values('Timestamp', kind='stable')
+            new_timestamps = to_epoch_ns(rows['Timestamp'])
+            if len(self):
+                newer = new_timestamps > self.timestamps[-1]
+                rows, new_timestamps = rows[newer], new_timestamps[newer]
+            if not len(rows):
+                return 0
+
+            offset = len(self)
+            if self._buffers is None:
+                # Memory-mapped columns are read-only, so appending copies them into memory once
+                self._timestamp_buffer = GrowableArray(self.timestamps, dtype=np.int64)
+                self._buffers = {}
+                for road in self.road_ids:
+                    values = self.column(road)
+                    if road in self.encoding:
+                        self._buffers[road] = GrowableArray(values.codes, dtype=QUANTIZED_DTYPE)
+                    else:
+                        self._buffers[road] = GrowableArray(values, dtype=np.float64)
+            new_roads = [col for col in rows.columns if col.startswith('Road_') and col not in self._road_set]
+            quantized = self.quantized
+            for road in new_roads:
+                # New roads of a fully quantized store start quantized too
+                if quantized:
+                    self._buffers[road] = GrowableArray(np.full(offset, MISSING_CODE, dtype=QUANTIZED_DTYPE))
+                    self.encoding[road] = QUANTIZED_DECIMALS[0]
+                else:
+                    self._buffers[road] = GrowableArray(np.full(offset, np.nan))
+            road_ids = self.road_ids + new_roads
+            block = rows.reindex(columns=road_ids).to_numpy(dtype=np.float64)
+            positions = {road: i for i, road in enumerate(road_ids)}
+
+            # Buffers and indexes grow first; the new columns and the timestamps are
+            # published together at the end, so a reader never sees one without the other
+            columns = {}
+            for road, i in positions.items():
+                buffer = self._buffers[road]
+                if road in self.encoding:
+                    codes = quantize(block[:, i], self.encoding[road])
+                    if codes is None:
+                        # A reading the road's codes cannot hold exactly: keep it as floats from now on
+                        buffer = self._buffers[road] = GrowableArray(dequantize(buffer.values, self.encoding[road]))
+                        del self.encoding[road]
+                    else:
+                        buffer.extend(codes)
+                        columns[road] = QuantizedColumn(buffer.values, self.encoding[road])
+                        continue
+                buffer.extend(block[:, i])
+                columns[road] = buffer.values
+            for key, index in list(self._indexes.items()):
+                if key[0] in ('events', 'rollup'):
+                    index.extend(block[:, positions[key[1]]], new_timestamps)
+                else:
+                    index.extend(block[:, positions[key[1]]])
+            self._timestamp_buffer.extend(new_timestamps)
+            self.road_ids = road_ids
+            self._road_set.update(new_roads)
+            self._columns.update(columns)
+            self.timestamps = self._timestamp_buffer.values
+            if self._summaries is not None:
+                self._summaries.add_roads(new_roads)
+                self._summaries.extend(block, offset)
+            self._extend_row_cache(offset, block, new_roads)
+            self.version += 1
+            touched = frozenset(road for road, i in positions.items() if not np.isnan(block[:, i]).all())
+            self.append_log.append((self.version, int(new_timestamps[0]), touched))
+            return len(rows)
+
+    def summaries(self):
+        """Whole-history summary table for all roads, computed here if not loaded with the store"""
+        if self._summaries is None:
+            self._summaries = RoadSummaries.from_columns(self.road_ids, self.column)
+        return self._summaries
+
+    def road_summary(self, road_id):
+        """Whole-history min, max, mean, count and latest reading of one road, with timestamps"""
+        summary = self.summaries().get(road_id)
+        for field in ('min', 'max', 'latest'):
+            position = summary.pop(f'{field}_pos')
+            summary[f'{field}_timestamp'] = self.timestamp_at(position) if position is not None else None
+        return summary
+
+    def _index(self, key, build):
+        """Fetch or build one lazy index under the lock, over the rows published so far
+
+        Building under the lock keeps append from growing the column or the
+        timestamps halfway through, and from missing the new index when it
+        extends the existing ones.
+        """
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+        with self.lock:
+            index = self._indexes.get(key)
+            if index is None:
+                rows = len(self.timestamps)
+                values = self.column(key[1])
+                if len(values) != rows:
+                    values = values[:rows]
+                index = self._indexes[key] = build(values, self.timestamps[:rows])
+            return index
+
+    def extremum_index(self, road_id, kind='max'):
+        """Range max/min index for one road, built the first time it is asked for"""
+        return self._index(('extremum', road_id, kind), lambda values, _: RangeExtremumIndex(values, kind))
+
+    def prefix_aggregates(self, road_id):
+        """Cumulative sums and counts for one road, built the first time they are asked for"""
+        return self._index(('prefix', road_id), lambda values, _: PrefixAggregates(values))
+
+    def event_index(self, road_id, threshold):
+        """Flood events of one road at an alert level, built the first time they are asked for"""
+        threshold = float(threshold)
+        return self._index(('events', road_id, threshold),
+                           lambda values, timestamps: FloodEventIndex(values, timestamps, threshold))
+
+    def rollups(self, road_id):
+        """Daily, weekly and monthly rollups for one road, built the first time they are asked for"""
+        return self._index(('rollup', road_id), lambda values, timestamps: RollupPyramid(values, timestamps))
+
+    def range_summary(self, road_id, start, end, index=None):
+        """Count, sum, mean, spread and extremes of one road's readings in a time range"""
+        lo, hi = self.slice_range(start, end)
+        if (index or RANGE_INDEX) == "rollup":
+            return self._rollup_summary(road_id, lo, hi)
+        prefix = self.prefix_aggregates(road_id)
+        summary = {
+            'rows': hi - lo,
+            'count': prefix.count(lo, hi),
+            'sum': prefix.sum(lo, hi),
+            'mean': prefix.mean(lo, hi),
+            'variance': prefix.variance(lo, hi),
+        }
+        values = self.column(road_id)
+        for kind in ('min', 'max'):
+            position = self.extremum_index(road_id, kind).query(lo, hi)
+            summary[kind] = float(values[position]) if position is not None else float('nan')
+            summary[f'{kind}_timestamp'] = self.timestamp_at(position) if position is not None else None
+        return summary
+
+    def _rollup_summary(self, road_id, lo, hi):
+        rollup = self.rollups(road_id).query(self.column(road_id), lo, hi)
+        count, total = rollup['count'], rollup['sum']
+        summary = {
+            'rows': hi - lo,
+            'count': count,
+            'sum': total,
+            'mean': total / count if count else float('nan'),
+            # Sample variance, matching PrefixAggregates.variance
+            'variance': (max(rollup['squares'] - total * total / count, 0.0) / (count - 1) if count > 1
+                         else float('nan')),
+        }
+        for kind in ('min', 'max', 'first', 'last'):
+            position = rollup[f'{kind}_pos']
+            summary[kind] = rollup[kind]
+            summary[f'{kind}_timestamp'] = self.timestamp_at(position) if position >= 0 else None
+        return summary
+
+    def timestamp_at(self, position):
+        return pd.Timestamp(int(self.timestamps[position]))
+
+    def first_timestamp(self):
+        return self.timestamp_at(0)
+
+    def last_timestamp(self):
+        return self.timestamp_at(-1)
+
+    def locate(self, timestamp, match='exact', tolerance=None):
+        """Binary-search the sorted timestamps for a reading and return its row, or None
+
+        match='exact' needs an identical timestamp; 'backward' takes the last
+        reading at or before it, 'forward' the first at or after, and 'nearest'
+        whichever is closer. tolerance caps how far an as-of match may be.
+        """
+        target = timestamp_ns(timestamp)
+        timestamps = self.timestamps
+        pos = int(np.searchsorted(timestamps, target, side='left'))
+        if match == 'exact':
+            return pos if pos < len(timestamps) and timestamps[pos] == target else None
+
+        after = pos if pos < len(timestamps) else None
+        if after is not None and timestamps[after] == target:
+            return after
+        before = pos - 1 if pos > 0 else None
+        if match == 'backward':
+            candidates = [before]
+        elif match == 'forward':
+            candidates = [after]
+        elif match == 'nearest':
+            candidates = [before, after]
+        else:
+            raise ValueError(f"Unknown match mode: {match}")
+
+        best = None
+        for candidate in candidates:
+            if candidate is None:
+                continue
+            distance = abs(int(timestamps[candidate]) - target)
+            if best is None or distance < best[0]:
+                best = (distance, candidate)
+        if best is None:
+            return None
+        if tolerance is not None and best[0] > pd.Timedelta(tolerance).value:
+            return None
+        return best[1]
+
+    def locate_many(self, timestamps):
+        """Exact-match locate for many timestamps with one searchsorted; -1 where there is no reading"""
+        targets = np.asarray([timestamp_ns(timestamp) for timestamp in timestamps], dtype=np.int64)
+        positions = np.searchsorted(self.timestamps, targets, side='left')
+        found = positions < len(self.timestamps)
+        found[found] = np.asarray(self.timestamps)[positions[found]] == targets[found]
+        return np.where(found, positions, -1)
+
+    def slice_range(self, start, end):
+        """Resolve an inclusive [start, end] time range to a [lo, hi) row slice"""
+        lo = int(np.searchsorted(self.timestamps, timestamp_ns(start), side='left'))
+        hi = int(np.searchsorted(self.timestamps, timestamp_ns(end), side='right'))
+        return lo, max(lo, hi)
+
+    def range_view(self, road_id, start, end):
+        """Zero-copy views of the timestamps and one road's readings within a time range"""
+        lo, hi = self.slice_range(start, end)
+        return self.timestamps[lo:hi], self.column(road_id)[lo:hi]
+
+    def timestamp_index(self, lo=0, hi=None):
+        return pd.DatetimeIndex(np.asarray(self.timestamps[lo:hi]).view('datetime64[ns]'), copy=False)
+
+    def frame(self, road_id, lo=0, hi=None):
+        """Two-column Timestamp/road DataFrame for a single road, optionally a row slice of it"""
+        return pd.DataFrame({
+            'Timestamp': self.timestamp_index(lo, hi),
+            road_id: self.column(road_id)[lo:hi],
+        }, copy=False)
+
+    def row_block(self, lo, hi):
+        """Rows [lo, hi) of every road as one (rows x roads) matrix, columns in road_ids order
+
+        A few rows within one aligned span come from a cached row-major copy of
+        that span, gathered from the columns once and carried forward by
+        appends; larger blocks are stacked from the columns directly.
+        """
+        first = lo - lo % ROW_CACHE_ROWS
+        if hi - first > ROW_CACHE_ROWS:
+            return self._gather_rows(lo, hi)
+        cached = self._row_cache
+        if cached is None or cached[0] != first or first + len(cached[1]) < hi or \
+                cached[1].shape[1] != len(self.road_ids):
+            with self.lock:
+                rows = min(first + ROW_CACHE_ROWS, len(self.timestamps))
+                cached = self._row_cache = (first, self._gather_rows(first, rows))
+        return cached[1][lo - first:hi - first].copy()
+
+    def _gather_rows(self, lo, hi):
+        # Each road's slice becomes one contiguous row of a roads x rows stack, codes decoded in one pass
+        columns = list(map(self.column, self.road_ids))
+        if not columns:
+            return np.empty((hi - lo, 0), dtype=np.float64)
+        coded = [i for i, values in enumerate(columns) if isinstance(values, QuantizedColumn)]
+        if not coded:
+            return np.stack([values[lo:hi] for values in columns]).T
+        decoded = dequantize(np.stack([columns[i].codes[lo:hi] for i in coded]),
+                             np.array([columns[i].decimals for i in coded])[:, None])
+        if len(coded) == len(columns):
+            return decoded.T
+        block = np.empty((len(columns), hi - lo), dtype=np.float64)
+        block[coded] = decoded
+        plain = np.setdiff1d(np.arange(len(columns)), coded)
+        block[plain] = np.stack([columns[i][lo:hi] for i in plain])
+        return block.T
+
+    def _extend_row_cache(self, offset, block, new_roads):
+        """Carry appended rows (block, in road_ids order) into a cached span they continue"""
+        cached = self._row_cache
+        if cached is None or new_roads:
+            # Old rows of new roads read as gaps, which the cached span lacks a column for
+            self._row_cache = None
+        elif cached[0] + len(cached[1]) == offset:
+            room = cached[0] + ROW_CACHE_ROWS - offset
+            if room > 0:
+                self._row_cache = (cached[0], np.vstack([cached[1], block[:room]]))
+
+    def code_block(self, lo, hi):
+        """Rows [lo, hi) of every road's int16 codes as one (rows x roads) matrix; needs a quantized store"""
+        block = np.empty((hi - lo, len(self.road_ids)), dtype=QUANTIZED_DTYPE)
+        for i, road in enumerate(self.road_ids):
+            block[:, i] = self.column(road).codes[lo:hi]
+        return block
+
+
+def store_from_frame(df, quantize_roads=False):
+    """Build an in-memory store from a DataFrame with a Timestamp column
+
+    With quantize_roads, every road whose readings fit int16 fixed-point codes
+    exactly is held as codes, a quarter of the memory.
+    """
+    df = df.sort_values('Timestamp', kind='stable')
+    road_ids = [col for col in df.columns if col.startswith('Road_')]
+    columns = {road: np.ascontiguousarray(df[road].to_numpy(dtype=np.float64)) for road in road_ids}
+    summaries = RoadSummaries.from_columns(road_ids, columns.__getitem__)
+    encoding = {}
+    if quantize_roads:
+        for road in road_ids:
+            codes, decimals = quantize_column(columns[road])
+            if codes is not None:
+                columns[road], encoding[road] = codes, decimals
+    return WaterStore(to_epoch_ns(df['Timestamp']), road_ids, columns.__getitem__, summaries, encoding)
+
+
+def open_store(directory):
+    """Open a columnar store, memory-mapping the timestamps and each road on demand"""
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    timestamps = np.load(os.path.join(directory, TIMESTAMP_FILE), mmap_mode='r')
+
+    def load_column(road_id):
+        return np.load(os.path.join(directory, f"{road_id}.npy"), mmap_mode='r')
+
+    summary_file = os.path.join(directory, SUMMARY_FILE)
+    summaries = RoadSummaries.load(summary_file) if os.path.exists(summary_file) else None
+    return WaterStore(timestamps, manifest['roads'], load_column, summaries, manifest.get('encoding'))
+
+
+def share_store(store):
+    """Move an in-memory store's readings into one shared-memory block for forked workers
+
+    Returns the shared store and the SharedMemory handle the owner must unlink.
+    Memory-mapped stores are already shared through the page cache and are
+    returned unchanged with no handle.
+    """
+    from multiprocessing import shared_memory
+    if isinstance(store.timestamps, np.memmap):
+        return store, None
+
+    rows = len(store)
+    quantized = [road for road in store.road_ids if road in store.encoding]
+    floats = [road for road in store.road_ids if road not in store.encoding]
+    code_bytes = (2 * rows * len(quantized) + 7) // 8 * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(8 * rows * (len(floats) + 1) + code_bytes, 1))
+    timestamps = np.ndarray((rows,), dtype=np.int64, buffer=shm.buf)
+    timestamps[:] = store.timestamps
+    # One row per road so every road's readings stay contiguous; quantized
+    # roads keep their int16 codes
+    matrix = np.ndarray((len(floats), rows), dtype=np.float64, buffer=shm.buf, offset=8 * rows)
+    codes = np.ndarray((len(quantized), rows), dtype=QUANTIZED_DTYPE, buffer=shm.buf,
+                       offset=8 * rows * (len(floats) + 1))
+    positions = {road: i for i, road in enumerate(floats)}
+    positions.update((road, i) for i, road in enumerate(quantized))
+    for road in floats:
+        matrix[positions[road]] = store.column(road)
+    for road in quantized:
+        codes[positions[road]] = store.column(road).codes
+
+    # The loader must not hold on to the old store, or its arrays outlive the swap
+    coded = set(quantized)
+
+    def load_column(road_id):
+        return codes[positions[road_id]] if road_id in coded else matrix[positions[road_id]]
+
+    return WaterStore(timestamps, store.road_ids, load_column, store.summaries(), store.encoding), shm
+
+
+def _is_current(directory, csv_path):
+    """True if the columnar store exists and was converted from the CSV as it is now"""
+    manifest_file = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    return manifest.get('source_mtime') == os.path.getmtime(csv_path)
+
+
+def data_version(csv_path):
+    """Cheap staleness key for a dataset: size and mtime of the CSV and of its columnar manifest"""
+    version = []
+    for path in (csv_path, os.path.join(columnar_path(csv_path), MANIFEST_FILE)):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            version.append(None)
+        else:
+            version.append((stat.st_size, stat.st_mtime_ns))
+    return tuple(version)
+
+
+def load_store(csv_path):
+    """Load the dataset, preferring an up-to-date columnar copy over parsing the CSV"""
+    directory = columnar_path(csv_path)
+    if _is_current(directory, csv_path):
+        return open_store(directory)
+    return store_from_frame(pd.read_csv(csv_path, parse_dates=['Timestamp']))
+
+
+def _truncate(path, rows):
+    """Rewrite a .npy file keeping only its first rows"""
+    values = np.load(path, mmap_mode='r')
+    with open(f"{path}.tmp", 'wb') as f:
+        np.save(f, values[:rows])
+    del values
+    os.replace(f"{path}.tmp", path)
+
+
+def convert_csv(csv_path, out_dir=None, chunk_rows=CONVERT_CHUNK_ROWS, quantize_roads=False):
+    """One-time conversion of a wide CSV into the columnar store format
+
+    With quantize_roads, each road is written as int16 codes at the finest
+    decimals its first chunk fits exactly; a road that later has a reading
+    the codes cannot hold is rewritten as float64.
+    """
+    out_dir = out_dir or columnar_path(csv_path)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_file = os.path.join(out_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+    road_ids = [col for col in header if col.startswith('Road_')]
+    # Lines bound the row count from above; blank lines are skipped by the parser,
+    # so the arrays are cut down to the rows actually read once the CSV is done
+    with open(csv_path, 'rb') as f:
+        rows = sum(1 for _ in f) - 1
+
+    def open_column(road, dtype, suffix=""):
+        return np.lib.format.open_memmap(os.path.join(out_dir, f"{road}.npy{suffix}"),
+                                         mode='w+', dtype=dtype, shape=(rows,))
+
+    # Stream the CSV in chunks straight into the on-disk arrays
+    timestamps = np.lib.format.open_memmap(os.path.join(out_dir, TIMESTAMP_FILE),
+                                           mode='w+', dtype=np.int64, shape=(rows,))
+    columns = {road: open_column(road, QUANTIZED_DTYPE if quantize_roads else np.float64) for road in road_ids}
+    encoding = {}
+    # Roads that fell back to floats, written beside the codes until the end
+    rewritten = set()
+    start = 0
+    for chunk in pd.read_csv(csv_path, parse_dates=['Timestamp'], chunksize=chunk_rows):
+        end = start + len(chunk)
+        timestamps[start:end] = to_epoch_ns(chunk['Timestamp'])
+        for road in road_ids:
+            values = chunk[road].to_numpy(dtype=np.float64)
+            if quantize_roads and road not in rewritten:
+                if road not in encoding:
+                    codes, encoding[road] = quantize_column(values)
+                else:
+                    codes = quantize(values, encoding[road])
+                if codes is not None:
+                    columns[road][start:end] = codes
+                    continue
+                floats = open_column(road, np.float64, ".tmp")
+                if encoding[road] is not None:
+                    floats[:start] = dequantize(columns[road][:start], encoding[road])
+                columns[road] = floats
+                del encoding[road]
+                rewritten.add(road)
+            columns[road][start:end] = values
+        start = end
+    if start < rows:
+        timestamps = timestamps[:start]
+        columns = {road: values[:start] for road, values in columns.items()}
+
+    # Lookups rely on sorted timestamps, so reorder everything if the CSV was not
+    if start and np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps[:] = timestamps[order]
+        for road in road_ids:
+            columns[road][:] = columns[road][order]
+
+    timestamps.flush()
+    for values in columns.values():
+        values.flush()
+    RoadSummaries.from_columns(
+        road_ids, lambda road: QuantizedColumn(columns[road], encoding[road]) if road in encoding else columns[road]
+    ).save(os.path.join(out_dir, SUMMARY_FILE))
+    del timestamps, columns
+    for road in rewritten:
+        os.replace(os.path.join(out_dir, f"{road}.npy.tmp"), os.path.join(out_dir, f"{road}.npy"))
+    if start < rows:
+        for name in [TIMESTAMP_FILE] + [f"{road}.npy" for road in road_ids]:
+            _truncate(os.path.join(out_dir, name), start)
+
+    # Manifest goes last so a half-written store is never picked up by load_store
+    manifest = {
+        'rows': start,
+        'roads': road_ids,
+        'source': os.path.basename(csv_path),
+        'source_mtime': os.path.getmtime(csv_path),
+        'encoding': encoding,
+    }
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f)
+    return out_dir
+
+
+if __name__ == "__main__":
+    quantize_roads = '--quantize' in sys.argv[1:]
+    for path in [arg for arg in sys.argv[1:] if arg != '--quantize'] or ['road_water_levels_large.csv']:
+        print(f"Converted {path} -> {convert_csv(path, quantize_roads=quantize_roads)}")